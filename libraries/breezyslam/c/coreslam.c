@@ -36,6 +36,12 @@
 #include <string.h>
 #include <math.h>
 
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <sys/time.h>
+#endif
+
 #include "coreslam.h"
 #include "coreslam_internals.h"
 
@@ -77,6 +83,22 @@ static void
 }
 
 
+/* Monotonic-enough wall clock in microseconds, for search time budgets */
+static int64_t time_us(void)
+{
+#ifdef _WIN32
+    LARGE_INTEGER frequency, counter;
+    QueryPerformanceFrequency(&frequency);
+    QueryPerformanceCounter(&counter);
+    return (int64_t)(counter.QuadPart * 1000000 / frequency.QuadPart);
+#else
+    struct timeval tv;
+    gettimeofday(&tv, NULL);
+    return (int64_t)tv.tv_sec * 1000000 + tv.tv_usec;
+#endif
+}
+
+
 static int roundup(double x)
 {
     return (int)floor(x + 0.5);
@@ -489,20 +511,67 @@ position_t
         double sigma_theta_degrees,
         int max_search_iter,
         void * randomizer)
+{
+    return rmhc_position_search_converge(
+        start_pos,
+        map,
+        scan,
+        sigma_xy_mm,
+        sigma_theta_degrees,
+        max_search_iter,
+        DEFAULT_SEARCH_SCORE_THRESHOLD,
+        DEFAULT_MIN_SIGMA_XY_MM,
+        DEFAULT_MIN_SIGMA_THETA_DEGREES,
+        DEFAULT_MAX_SEARCH_TIME_US,
+        randomizer,
+        NULL);
+}
+
+position_t
+        rmhc_position_search_converge(
+        position_t start_pos,
+        map_t * map,
+        scan_t * scan,
+        double sigma_xy_mm,
+        double sigma_theta_degrees,
+        int max_search_iter,
+        int score_threshold,
+        double min_sigma_xy_mm,
+        double min_sigma_theta_degrees,
+        long max_search_time_us,
+        void * randomizer,
+        rmhc_stats_t * stats)
 {
     position_t currentpos = start_pos;
     position_t bestpos = start_pos;
     position_t lastbestpos = start_pos;
     
+    int64_t start_us = max_search_time_us > 0 ? time_us() : 0;
+    
     int current_distance = distance_scan_to_map(map, scan, currentpos);
     
     int lowest_distance =  current_distance;
     int last_lowest_distance = current_distance;
     
     int counter = 0;
+    int iterations = 0;
+    
+    int check_sigmas = (min_sigma_xy_mm > 0) || (min_sigma_theta_degrees > 0);
     
     while (counter < max_search_iter)
     {
+        /* Start position (or last improvement) is already good enough */
+        if ((score_threshold >= 0) && (lowest_distance > -1) && (lowest_distance <= score_threshold))
+        {
+            break;
+        }
+        
+        /* Out of time for this scan */
+        if ((max_search_time_us > 0) && (time_us() - start_us >= max_search_time_us))
+        {
+            break;
+        }
+        
         currentpos = lastbestpos;
         
         currentpos.x_mm = random_normal(randomizer, currentpos.x_mm, sigma_xy_mm);
@@ -510,6 +579,7 @@ position_t
         currentpos.theta_degrees = random_normal(randomizer, currentpos.theta_degrees, sigma_theta_degrees);
         
         current_distance = distance_scan_to_map(map, scan, currentpos);
+        iterations++;
         
         /* -1 indicates infinity */
         if ((current_distance > -1) && (current_distance < lowest_distance))
@@ -531,10 +601,25 @@ position_t
                 counter = 0;
                 sigma_xy_mm *= 0.5;
                 sigma_theta_degrees *= 0.5;
+                
+                /* Search has narrowed as far as we care about */
+                if (check_sigmas &&
+                    (min_sigma_xy_mm <= 0 || sigma_xy_mm < min_sigma_xy_mm) &&
+                    (min_sigma_theta_degrees <= 0 || sigma_theta_degrees < min_sigma_theta_degrees))
+                {
+                    break;
+                }
             }
         }
         
     }
     
+    if (stats)
+    {
+        stats->iterations = iterations;
+        stats->evaluations = iterations + 1;
+        stats->score = lowest_distance;
+    }
+    
     return bestpos;
 }
@@ -29,6 +29,12 @@ static const double DEFAULT_SIGMA_THETA_DEGREES = 20;
 
 static const double DEFAULT_MAX_SEARCH_ITER     = 1000;
 
+/* Convergence controls for RMHC search; zero or negative disables each one */
+static const int    DEFAULT_SEARCH_SCORE_THRESHOLD      = -1;
+static const double DEFAULT_MIN_SIGMA_XY_MM             = 0;
+static const double DEFAULT_MIN_SIGMA_THETA_DEGREES     = 0;
+static const long   DEFAULT_MAX_SEARCH_TIME_US          = 0;
+
 
 /* Core types --------------------------------------------------------------- */
 
@@ -75,6 +81,14 @@ typedef struct scan_t
         
 } scan_t;
 
+typedef struct rmhc_stats_t
+{
+    int iterations;                     /* random mutations tried */
+    int evaluations;                    /* calls to distance_scan_to_map */
+    int score;                          /* distance of returned position, -1 for infinity */
+    
+} rmhc_stats_t;
+
 /* Exported functions ------------------------------------------------------- */
 
 #ifdef __cplusplus 
@@ -163,6 +177,25 @@ rmhc_position_search(
 	int max_search_iter,
 	void * randomizer);
 
+/* Random-Mutation Hill-Climbing search with early exit:
+   stops once score <= score_threshold, once both sigmas have been halved
+   below their minimums, or once max_search_time_us has elapsed.
+   stats may be NULL. */
+position_t 
+rmhc_position_search_converge(
+    position_t start_pos,
+    map_t * map,
+    scan_t * scan,
+    double sigma_xy_mm,
+    double sigma_theta_degrees,
+    int max_search_iter,
+    int score_threshold,
+    double min_sigma_xy_mm,
+    double min_sigma_theta_degrees,
+    long max_search_time_us,
+    void * randomizer,
+    rmhc_stats_t * stats);
+
 #ifdef __cplusplus 
 }
 #endif
@@ -26,6 +26,7 @@ import pybreezyslam
 
 import math
 import time
+from collections import namedtuple
 
 # Basic params
 _DEFAULT_MAP_QUALITY         = 50 # out of 255
@@ -36,6 +37,17 @@ _DEFAULT_SIGMA_XY_MM         = 100
 _DEFAULT_SIGMA_THETA_DEGREES = 20
 _DEFAULT_MAX_SEARCH_ITER     = 1000
 
+# RMHC convergence params (zero or negative disables each one)
+_DEFAULT_SCORE_THRESHOLD         = -1
+_DEFAULT_MIN_SIGMA_XY_MM         = 0
+_DEFAULT_MIN_SIGMA_THETA_DEGREES = 0
+_DEFAULT_MAX_SEARCH_TIME_US      = 0
+
+# Per-update record returned by CoreSLAM.update() -------------------------------------------------------------------
+
+UpdateStats = namedtuple('UpdateStats', 
+    ['valid_points', 'obstacle_points', 'evaluations', 'score', 'search_seconds', 'map_update_seconds', 'used_odometry'])
+
 # CoreSLAM class ------------------------------------------------------------------------------------------------------
 
 class CoreSLAM(object):
@@ -59,7 +71,8 @@ class CoreSLAM(object):
     
       _updateMapAndPointcloud(scan_mm, velocities)
     
-    to update the map and point-cloud (particle cloud).
+    to update the map and point-cloud (particle cloud), and should set search_evaluations, search_score,
+    search_seconds and map_update_seconds for the UpdateStats record returned by update().
     '''
     
     def __init__(self, laser, map_size_pixels, map_size_meters, 
@@ -89,16 +102,29 @@ class CoreSLAM(object):
                 
         # Initialize the map 
         self.map = pybreezyslam.Map(map_size_pixels, map_size_meters)
+        
+        # Initialize search and timing results of the last update
+        self.search_iterations = 0
+        self.search_evaluations = 0
+        self.search_score = -1
+        self.search_seconds = 0
+        self.map_update_seconds = 0
                 
-    def update(self, scans_mm, velocities):
+    def update(self, scans_mm, velocities=None):
         '''
         Updates the scan and odometry, and calls the the implementing class's _updateMapAndPointcloud method with
         the specified velocities.
          
-        scan_mm is a list of Lidar scan values, whose count is specified in the scan_size 
+        scan_mm is a list (or contiguous int32 array) of Lidar scan values, whose count is specified in the scan_size 
         attribute of the Laser object passed to the CoreSlam constructor
-        velocities is a tuple of velocities (dxy_mm, dtheta_degrees, dt_seconds) for odometry
+        velocities is a tuple of velocities (dxy_mm, dtheta_degrees, dt_seconds) for odometry, or None for no odometry
+        
+        Returns an UpdateStats record describing the scan, the position search and how long each step took.
         '''
+        
+        used_odometry = velocities is not None
+        if not used_odometry:
+            velocities = (0, 0, 0)
 
         # Build a scan for computing distance to map, and one for updating map 
         self._scan_update(self.scan_for_mapbuild, scans_mm)
@@ -113,6 +139,15 @@ class CoreSLAM(object):
         # Implementing class updates map and pointcloud
         self._updateMapAndPointcloud(velocities)
         
+        return UpdateStats(
+            self.scan_for_distance.valid_npoints, 
+            self.scan_for_distance.obst_npoints, 
+            self.search_evaluations, 
+            self.search_score, 
+            self.search_seconds, 
+            self.map_update_seconds, 
+            used_odometry)
+        
     def getmap(self, mapbytes):
         '''
         Fills bytearray mapbytes with map pixels, where bytearray length is square of map size passed
@@ -177,10 +212,14 @@ class SinglePositionSLAM(CoreSLAM):
         start_pos.y_mm  += self.laser.offset_mm * self._sintheta()
 
         # Get new position from implementing class
+        search_start = time.time()
         new_position = self._getNewPosition(start_pos)
+        self.search_seconds = time.time() - search_start
                 
         # Update the map with this new position
+        map_update_start = time.time()
         self.map.update(self.scan_for_mapbuild, new_position, self.map_quality, self.hole_width_mm)
+        self.map_update_seconds = time.time() - map_update_start
       
         # Update the current position with this new position, adjusted by laser offset
         self.position = new_position.copy()        
@@ -217,7 +256,9 @@ class RMHC_SLAM(SinglePositionSLAM):
     def __init__(self, laser, map_size_pixels, map_size_meters, 
                 map_quality=_DEFAULT_MAP_QUALITY, hole_width_mm=_DEFAULT_HOLE_WIDTH_MM,
                 random_seed=None, sigma_xy_mm=_DEFAULT_SIGMA_XY_MM, sigma_theta_degrees=_DEFAULT_SIGMA_THETA_DEGREES, 
-                max_search_iter=_DEFAULT_MAX_SEARCH_ITER):
+                max_search_iter=_DEFAULT_MAX_SEARCH_ITER, score_threshold=_DEFAULT_SCORE_THRESHOLD,
+                min_sigma_xy_mm=_DEFAULT_MIN_SIGMA_XY_MM, min_sigma_theta_degrees=_DEFAULT_MIN_SIGMA_THETA_DEGREES,
+                max_search_time_us=_DEFAULT_MAX_SEARCH_TIME_US):
         '''
         Creates a RMHCSlam object suitable for updating with new Lidar and odometry data.
         laser is a Laser object representing the specifications of your Lidar unit
@@ -231,6 +272,14 @@ class RMHC_SLAM(SinglePositionSLAM):
         sigma_theta_degrees specifies the standard deviation in degrees of the normal distribution of 
            the rotational component of position for RMHC search
         max_search_iter specifies the maximum number of iterations for RMHC search
+        score_threshold stops RMHC search as soon as the scan-to-map distance is at or below it; 
+           negative disables
+        min_sigma_xy_mm and min_sigma_theta_degrees stop RMHC search once the halved sigmas fall
+           below them; zero disables
+        max_search_time_us is the wall-clock budget in microseconds for one RMHC search; zero disables
+        
+        After each update, search_iterations, search_evaluations and search_score report how much 
+        searching was done and the distance of the position found (-1 for infinity).
         '''
     
         SinglePositionSLAM.__init__(self, laser, map_size_pixels, map_size_meters, 
@@ -244,14 +293,14 @@ class RMHC_SLAM(SinglePositionSLAM):
         self.sigma_xy_mm = sigma_xy_mm
         self.sigma_theta_degrees = sigma_theta_degrees
         self.max_search_iter = max_search_iter
+        self.score_threshold = score_threshold
+        self.min_sigma_xy_mm = min_sigma_xy_mm
+        self.min_sigma_theta_degrees = min_sigma_theta_degrees
+        self.max_search_time_us = max_search_time_us
         
     def update(self, scan_mm, velocities=None):
-
-        if not velocities:
-        
-            velocities = (0, 0, 0)
     
-        CoreSLAM.update(self, scan_mm, velocities)    
+        return CoreSLAM.update(self, scan_mm, velocities)    
     
     def _getNewPosition(self, start_position):
         '''
@@ -260,15 +309,22 @@ class RMHC_SLAM(SinglePositionSLAM):
         '''     
         
         # RMHC search is implemented as a C extension for efficiency
-        return pybreezyslam.rmhcPositionSearch(
-            start_position, 
-            self.map, 
-            self.scan_for_distance, 
-            self.laser,
-            self.sigma_xy_mm,
-            self.sigma_theta_degrees,
-            self.max_search_iter,
-            self.randomizer)
+        new_position, self.search_iterations, self.search_evaluations, self.search_score = \
+            pybreezyslam.rmhcPositionSearch(
+                start_position, 
+                self.map, 
+                self.scan_for_distance, 
+                self.laser,
+                self.sigma_xy_mm,
+                self.sigma_theta_degrees,
+                self.max_search_iter,
+                self.randomizer,
+                self.score_threshold,
+                self.min_sigma_xy_mm,
+                self.min_sigma_theta_degrees,
+                self.max_search_time_us)
+                
+        return new_position
                              
     def _random_normal(self, mu, sigma):
         
@@ -200,6 +200,7 @@ typedef struct
     
     scan_t scan;
     int * lidar_mm;
+    int valid_npoints;
     
 } Scan;
 
@@ -303,14 +304,14 @@ Scan_update(Scan *self, PyObject *args, PyObject *kwds)
     }
 
     // Bozo filter on LIDAR argument
-    if (!PyList_Check(py_lidar))
+    if (!PyList_Check(py_lidar) && !PyObject_CheckBuffer(py_lidar))
     {
         return null_on_raise_argument_exception_with_details("Scan", "update", 
-            "lidar must be a list");
+            "lidar must be a list or an int32 array");
     }
     
     // Bozo filter on LIDAR argument list size
-    if (PyList_Size(py_lidar) != self->scan.size)
+    if (PyList_Check(py_lidar) && PyList_Size(py_lidar) != self->scan.size)
     {        
         return null_on_raise_argument_exception_with_details("Scan", "update", 
             "lidar size mismatch");
@@ -341,9 +342,51 @@ Scan_update(Scan *self, PyObject *args, PyObject *kwds)
 
     // Extract LIDAR values from argument
     int k = 0;
+    if (PyList_Check(py_lidar))
+    {
+        for (k=0; k<self->scan.size; ++k)
+        {
+            self->lidar_mm[k] = PyFloat_AsDouble(PyList_GetItem(py_lidar, k));
+        }
+    }
+    
+    // Contiguous int32 arrays (e.g. from NumPy) are copied directly
+    else
+    {
+        Py_buffer view;
+        
+        if (PyObject_GetBuffer(py_lidar, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+        {
+            return null_on_raise_argument_exception_with_details("Scan", "update", 
+                "lidar array must be contiguous");
+        }
+        
+        if (view.itemsize != sizeof(int) || !view.format || !strpbrk(view.format, "il"))
+        {
+            PyBuffer_Release(&view);
+            return null_on_raise_argument_exception_with_details("Scan", "update", 
+                "lidar array must contain int32 values");
+        }
+        
+        if (view.len != self->scan.size * (Py_ssize_t)sizeof(int))
+        {
+            PyBuffer_Release(&view);
+            return null_on_raise_argument_exception_with_details("Scan", "update", 
+                "lidar size mismatch");
+        }
+        
+        memcpy(self->lidar_mm, view.buf, view.len);
+        PyBuffer_Release(&view);
+    }
+    
+    // Count readings that saw something
+    self->valid_npoints = 0;
     for (k=0; k<self->scan.size; ++k)
     {
-        self->lidar_mm[k] = PyFloat_AsDouble(PyList_GetItem(py_lidar, k));
+        if (self->lidar_mm[k])
+        {
+            self->valid_npoints++;
+        }
     }
     
     // Update the scan
@@ -362,7 +405,7 @@ static PyMethodDef Scan_methods[] =
 {
     {"update", (PyCFunction)Scan_update, METH_VARARGS | METH_KEYWORDS, 
     "Scan.update(scans_mm, hole_width_mm, velocities=None) updates scan.\n"\
-    "scans_mm is a list of integers representing scanned distances in mm.\n"\
+    "scans_mm is a list (or contiguous int32 array) of integers representing scanned distances in mm.\n"\
     "hole_width_mm is the width of holes (obstacles, walls) in millimeters.\n"\
     "velocities is an optional tuple containing at least dxy_mm, dtheta_degrees;\n"\
     "i.e., robot's (forward, rotational velocity) for improving the quality of the scan."
@@ -370,6 +413,16 @@ static PyMethodDef Scan_methods[] =
     {NULL}  // Sentinel 
 };
 
+static PyMemberDef Scan_members[] = {
+    {"valid_npoints", T_INT, offsetof(Scan, valid_npoints), READONLY,
+    "Number of nonzero Lidar distances passed to the last update"},
+    {"npoints", T_INT, offsetof(Scan, scan.npoints), READONLY,
+    "Number of points (obstacle and free) built by the last update"},
+    {"obst_npoints", T_INT, offsetof(Scan, scan.obst_npoints), READONLY,
+    "Number of obstacle points built by the last update"},
+    {NULL}  /* Sentinel */
+};
+
 #define TP_DOC_SCAN \
 "A class for Lidar scans.\n" \
 "Scan.__init__(laser, span=1)\n"\
@@ -412,7 +465,7 @@ static PyTypeObject pybreezyslam_ScanType =
     0,                                          // tp_iter 
     0,                                          // tp_iternext 
     Scan_methods,                         		// tp_methods 
-    0,                         					// tp_members 
+    Scan_members,                         		// tp_members 
     0,                                          // tp_getset 
     0,                                          // tp_base 
     0,                                          // tp_dict 
@@ -774,9 +827,14 @@ rmhcPositionSearch(PyObject *self, PyObject *args)
 	double sigma_theta_degrees = 0;
 	int max_search_iter = 0;
 	Randomizer * py_randomizer = NULL;
+    int score_threshold = DEFAULT_SEARCH_SCORE_THRESHOLD;
+    double min_sigma_xy_mm = DEFAULT_MIN_SIGMA_XY_MM;
+    double min_sigma_theta_degrees = DEFAULT_MIN_SIGMA_THETA_DEGREES;
+    long max_search_time_us = DEFAULT_MAX_SEARCH_TIME_US;
+    rmhc_stats_t stats;
 	
     // Extract Python objects for map, scan, and position
-    if (!PyArg_ParseTuple(args, "OOOOddiO", 
+    if (!PyArg_ParseTuple(args, "OOOOddiO|iddl", 
         &py_start_pos,
         &py_map,
         &py_scan,
@@ -784,7 +842,11 @@ rmhcPositionSearch(PyObject *self, PyObject *args)
         &sigma_xy_mm,
         &sigma_theta_degrees,
         &max_search_iter,
-        &py_randomizer))
+        &py_randomizer,
+        &score_threshold,
+        &min_sigma_xy_mm,
+        &min_sigma_theta_degrees,
+        &max_search_time_us))
     {        
         return null_on_raise_argument_exception("breezyslam.algorithms", "rmhcPositionSearch");
     }
@@ -793,14 +855,19 @@ rmhcPositionSearch(PyObject *self, PyObject *args)
     position_t start_pos = pypos2cpos(py_start_pos);
 
 	position_t likeliest_position = 
-    rmhc_position_search(
+    rmhc_position_search_converge(
         start_pos,
         &py_map->map,
         &py_scan->scan,
         sigma_xy_mm,
         sigma_theta_degrees,
         max_search_iter,
-        py_randomizer->randomizer);    
+        score_threshold,
+        min_sigma_xy_mm,
+        min_sigma_theta_degrees,
+        max_search_time_us,
+        py_randomizer->randomizer,
+        &stats);    
     
     
     // Convert C position back to Python object
@@ -812,7 +879,17 @@ rmhcPositionSearch(PyObject *self, PyObject *args)
     PyObject_CallObject((PyObject *) &pybreezyslam_PositionType, argList);
     Py_DECREF(argList);	
     
-    return py_likeliest_position;
+    if (py_likeliest_position == NULL)
+    {
+        return NULL;
+    }
+    
+    // Return position along with how much searching it took
+    return Py_BuildValue("Niii", 
+        py_likeliest_position,
+        stats.iterations,
+        stats.evaluations,
+        stats.score);
     
 }
 
@@ -828,7 +905,9 @@ static PyMethodDef module_methods[] =
     "position is a breezyslam.components.Position object\n"\
     },
     {"rmhcPositionSearch", rmhcPositionSearch, METH_VARARGS,
-        "rmhcPositionSearch(startpos, map, scan, laser, sigma_xy_mm, max_iter, randomizer)\n"
+        "rmhcPositionSearch(startpos, map, scan, laser, sigma_xy_mm, sigma_theta_degrees, max_iter, randomizer,\n"
+    "                   score_threshold=-1, min_sigma_xy_mm=0, min_sigma_theta_degrees=0, max_search_time_us=0)\n"
+    "Returns (position, iterations, evaluations, score).\n"
     "Internal use only."
     },
     {NULL, NULL, 0, NULL}        /* Sentinel */
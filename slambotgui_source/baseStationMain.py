@@ -24,42 +24,67 @@ This is free software, and you are welcome to redistribute it \n\
 under certain conditions; please cite the source."
 
 import sys, os, time
+import numpy as np
+from math import degrees, atan2
 print("Python {}.{}.{}".format(*sys.version_info[0:3]))
 
 # used in Root class
-from slambotgui.tools import paddedStr, PYTHON_SERIES, askForFile
+from slambotgui.tools import paddedStr, PYTHON_SERIES, askForFile, NearestResizer
 if PYTHON_SERIES == 2:
-  from Tkinter import Tk, StringVar
-  from tkMessageBox import askokcancel
   from Queue import Queue
   from Queue import Empty as QueueEmpty
 elif PYTHON_SERIES == 3:
-  from tkinter import Tk, StringVar
-  from tkinter.messagebox import askokcancel
   from queue import Queue
   from queue import Empty as QueueEmpty
 from slambotgui.dataprocessing import DataMatrix
 from slambotgui.slams import Slam
 from slambotgui.comms import SerialThread
-from slambotgui.guis import RegionFrame, InsetFrame, EntryFrame
+from slambotgui.exploration import ExplorationThread, frontierCleared, MAX_FAILED_PLANS
+from slambotgui.rendering import RenderThread
+from slambotgui.saving import SaveThread, writeSnapshot, viewImage
 from slambotgui.components import DaguRover5, RPLIDAR
 
 # User preferences
+HEADLESS = '--headless' in sys.argv # no windows: only gather data, do SLAM, log, and save map snapshots (for computers without displays)
 INTERNAL_MAP = True
 SMARTNESS_ON = True
+PLAN_PATHS = True # clicking the inset map sets a goal, and the robot drives there around obstacles (needs SMARTNESS_ON)
+EXPLORE = False # the robot picks its own goals, driving to frontiers of the map until none are left (needs PLAN_PATHS)
 FAST_MAPPING = True
+MAP_SERVER = False # stream the map to web browsers at http://MAP_SERVER_HOST:MAP_SERVER_PORT/, sending only tiles that changed
 LOG_ALL_DATA = False
 logFileDirectory = ['examples'] # leave as empty string in list for current directory
 logFileName = 'test.log'
-if FAST_MAPPING: from slambotgui.cvslamshow import SlamShow # uses OpenCV
+if HEADLESS: PLAN_PATHS = EXPLORE = FAST_MAPPING = False # nothing to show, and goals are driven to through the command box
+if MAP_SERVER: from slambotgui.mapserver import MapServer
+
+# GUI toolkits, which are never loaded when HEADLESS
+if HEADLESS: from slambotgui.tools import EventLoop, TextVar # plain stand-ins for the Tk root and StringVar
+elif PYTHON_SERIES == 2:
+  from Tkinter import Tk, StringVar
+  from tkMessageBox import askokcancel
+elif PYTHON_SERIES == 3:
+  from tkinter import Tk, StringVar
+  from tkinter.messagebox import askokcancel
+if not HEADLESS: from slambotgui.guis import RegionFrame, InsetFrame, EntryFrame, TkPoster
 
 # SLAM preferences
 USE_ODOMETRY = True
+DESKEW_SCANS = True # correct scans for robot motion during each sweep (needs USE_ODOMETRY)
 MAP_QUALITY = 7
+SEARCH_SCORE_THRESHOLD = -1 # stop scan matching once scan-to-map distance is this low (lower is better), -1 for never
+SEARCH_MIN_SIGMA_XY_MM = 0.5 # stop scan matching once search has narrowed below this position spread [mm], 0 for never
+SEARCH_MIN_SIGMA_THETA_DEG = 0.1 # stop scan matching once search has narrowed below this heading spread [deg], 0 for never
+SEARCH_TIME_US = 50000 # wall-clock budget for each scan match [us], 0 for none # keep well under the time between scans
 
 # GUI constants
-DATA_RATE = 50 # minimum time between updating data from lidar [ms]
-MAP_RATE = 500 # minimum time between updating map [ms]
+MAP_RATE = 500 # minimum time between updating map [ms] # scans are processed as soon as they arrive
+RENDER_FPS = 10 # most frames per second to draw the OpenCV map at, on its own thread (used if FAST_MAPPING)
+SNAPSHOT_PERIOD = 60 # time between saving map images [s] (used if HEADLESS)
+SAVE_FORMAT = 'png' # map file to save: 'png' image with the robot's path, plain 'pgm' map, or compressed numpy 'npz' of it all
+EXPORT_TILES = False # each time the map is saved, also update a zoomable tile pyramid of it in tiles/ (for very large maps)
+MAP_SERVER_HOST = 'localhost' # interface to serve the map on, '' for all of them (used if MAP_SERVER)
+MAP_SERVER_PORT = 8080 # (used if MAP_SERVER)
 
 # Protocol constants
 NUM_SAMP = 370 # number of serial packets needed for 1 scan (guesstimate)
@@ -68,6 +93,11 @@ NUM_SAMP = 370 # number of serial packets needed for 1 scan (guesstimate)
 DIST_MIN = 100; # minimum distance
 DIST_MAX = 6000; # maximum distance
 
+# Scan constants
+SCAN_BINS = 720 # angular bins per scan (360 is 1deg, 720 is 0.5deg, 1440 is 0.25deg) # Arduino sends angles to 1/8deg
+SCAN_AGGREGATE = 'min' # how to combine points in the same bin: 'last', 'min' or 'median'
+SCAN_GAP_BINS = 2 # longest run of empty bins to fill by interpolation, 0 for none
+
 # Map constants
 MAP_SIZE_M = 14.0 # size of region to be mapped [m]
 INSET_SIZE_M = 2.0 # size of relative map
@@ -78,10 +108,19 @@ CV_IMG_RES_PIX_PER_MM = CV_IMG_SIZE/MAP_SIZE_M/1000 # number of pixels of data p
 MAP_DEPTH = 5 # depth of data points on map (levels of certainty)
 print("Each pixel is " + str(round(1000.0/MAP_RES_PIX_PER_M,1)) + "mm, or " + str(round(1000.0/MAP_RES_PIX_PER_M/25.4,2)) + "in.")
 
-KWARGS_keys = ['logFile','MAP_SIZE_M','INSET_SIZE_M','MAP_RES_PIX_PER_M','MAP_DEPTH','INTERNAL_MAP','SMARTNESS_ON','USE_ODOMETRY','MAP_QUALITY']
+KWARGS_keys = ['logFile','MAP_SIZE_M','INSET_SIZE_M','MAP_RES_PIX_PER_M','MAP_DEPTH','INTERNAL_MAP','SMARTNESS_ON','USE_ODOMETRY','MAP_QUALITY',
+               'SEARCH_SCORE_THRESHOLD','SEARCH_MIN_SIGMA_XY_MM','SEARCH_MIN_SIGMA_THETA_DEG','SEARCH_TIME_US','DESKEW_SCANS',
+               'SCAN_AGGREGATE','SCAN_GAP_BINS','PLAN_PATHS']
 
 
 def main():
+  if HEADLESS:
+    root = EventLoop() # runs the same loops as Tk would, without a window
+    app = App(root)
+    try: root.mainloop()
+    except KeyboardInterrupt: app.closeWin() # Ctrl-C is how to stop
+    return
+
   root = Tk() # create tkinter window
   root.lower() # send tkinter window to back
 
@@ -98,47 +137,74 @@ class App(object):
   # init              creates all objects, draws initUI, and starts all loops (including serial thread)
   # closeWin          first prompts the user if they really want to close, then ends serial thread and tkinter
   # restartAll        restarts all objects that store map data, allowing history to be wiped without hard reset
+  # finishRestart     makes the new objects, once the exploration thread is done with the old map
+  # onSerial          (serial thread) hands serial events over to the main thread
+  # showStatus        shows the newest status from the serial thread
   # setDisplayMode    link to data.setDisplayMode function (prevents restart from breaking reference)
   # setRelDestination link to data.setRelDestination function (prevents restart from breaking reference)
-  # saveImage         tells data object to capture the current map and save as a png
+  # setRelGoal        link to data.setRelGoal function (prevents restart from breaking reference)
+  # sendWaypoint      sends the robot a command to drive straight to a point relative to it
+  # explore           when the robot has no goal, or its frontier was explored or can't be reached, sets the next frontier picked as its goal
+  # renderRegion      draws a map snapshot for the OpenCV window, on the render thread
+  # showRegion        shows the newest snapshot in the OpenCV window, on the main thread
+  # saveImage         snapshots the current map and has the save thread write it in SAVE_FORMAT
+  # imageSaved        reports a finished save in the status bar, and opens the image
   # getScanData       pulls LIDAR data directly from the serial port and does preliminary processing
-  # updateData        calls getScanData, and updates the slam object and data matrix with this data, and loops to itself
-  # updateMap         draws a new map, using whatever data is available, and loops to itself
+  # scansQueued       counts the whole scans in RXQueue, by the encoder packet that ends each one
+  # updateData        calls getScanData, and updates the slam object and data matrix with this data, for each waiting scan
+  # requestMap        has the map redrawn as soon as MAP_RATE allows, after it changed
+  # updateMap         draws a new map, using whatever data is available
+  # saveSnapshot      saves the map every SNAPSHOT_PERIOD (used if HEADLESS)
 
   def __init__(self, master):
-    self.master = master # root tk window
-    self.master.protocol("WM_DELETE_WINDOW", self.closeWin) # control what happens when a window is closed externally (e.g. by the 'x')
-    self.master.wm_title("Aerospace Robotics LIDAR Viewer") # name window
-    self.master.geometry('+100+50') # position window 100,100 pixels from top-left corner
+    self.master = master # root tk window, or EventLoop if HEADLESS
+    if not HEADLESS:
+      self.master.protocol("WM_DELETE_WINDOW", self.closeWin) # control what happens when a window is closed externally (e.g. by the 'x')
+      self.master.wm_title("Aerospace Robotics LIDAR Viewer") # name window
+      self.master.geometry('+100+50') # position window 100,100 pixels from top-left corner
 
     # physical objects
     self.robot = DaguRover5()
-    self.laser = RPLIDAR(DIST_MIN, DIST_MAX)
+    self.laser = RPLIDAR(DIST_MIN, DIST_MAX, SCAN_BINS)
 
     # initialize serial object, prompting user for input if required
     self.statusQueue = Queue() # status of serial thread # FIFO queue by default
     self.RXQueue = Queue() # data from serial to root # FIFO queue by default
     self.TXQueue = Queue() # data from root to serial # FIFO queue by default
-    self.serThread = SerialThread(self.laser, self.statusQueue, self.RXQueue, self.TXQueue) # initialize thread object
+    # the loop sleeps until a thread posts something for it to do, instead of checking the queues on a timer
+    self.post = self.master.post if HEADLESS else TkPoster(self.master).post # (any thread) run a function on the main thread
+    self.serThread = SerialThread(self.laser, self.statusQueue, self.RXQueue, self.TXQueue, notify=self.onSerial)
+    self.explorer = ExplorationThread(notify=lambda: self.post(self.explorerDone)) # picks frontiers off the main thread, used if EXPLORE
+    self.visitedGoals = [] # frontier pixels already given as goals, which the explorer won't pick again
+    self.exploreGoal = None # goal given by explore, rather than clicked on the inset map [mm]
+    self.saver = SaveThread(notify=lambda: self.post(self.saver.runCallbacks)) # writes map snapshots off the main thread
 
     # initialize root variables
-    self.statusStr = StringVar() # status of serThread
+    self.statusStr = TextVar() if HEADLESS else StringVar() # status of serThread
     self.restarting = False # are we in the process of soft restarting?
     self.paused = False # should the loops be doing nothing right now?
+    self.dataInit = True # still waiting for the first full scan?
+    self.mapRequested = False # is updateMap already scheduled?
+    self.lastMapTime = 0 # when updateMap last ran [s]
 
     # helper objects
     self.data = DataMatrix(**KWARGS) # handle map data
     self.slam = Slam(self.robot, self.laser, **KWARGS) # do slam processing
 
-    if FAST_MAPPING:
-      # create the OpenCV window
-      self.regionFrame = SlamShow(CV_IMG_SIZE, CV_IMG_RES_PIX_PER_MM, 'SLAM Rover: Hit ESC to quit')
+    if HEADLESS: pass # nothing to draw, saveSnapshot saves the map instead
+    elif FAST_MAPPING:
+      # the OpenCV window is made and drawn by the render thread, so slow drawing doesn't hold up the data loop
+      self.regionFrame = None # created by renderRegion
+      self.regionImage = None # newest frame drawn by renderRegion, waiting for showRegion
+      self.regionResizer = NearestResizer((CV_IMG_SIZE,CV_IMG_SIZE)) # only used on the render thread
+      self.renderThread = RenderThread(self.renderRegion, RENDER_FPS)
       # create Tkinter control frames
       self.statusFrame = EntryFrame(self.master, self.robot, self.closeWin, self.restartAll, self.saveImage, \
                                     self.serThread.getACK, self.serThread.resetACK, self.TXQueue, self.statusStr, 
                                     twoLines=True, setDisplayMode=self.setDisplayMode, **KWARGS)
       self.insetFrame = InsetFrame(self.master, self.data.getInsetMatrix(),
-                                   sendCommand=self.statusFrame.sendCommand, setRelDestination=self.setRelDestination, **KWARGS)
+                                   sendCommand=self.statusFrame.sendCommand, setRelDestination=self.setRelDestination,
+                                   setRelGoal=self.setRelGoal if PLAN_PATHS else None, **KWARGS)
       # pack frame
       self.statusFrame.pack(side='bottom', fill='x')
       self.insetFrame.pack(side='left', fill='both', expand=True)
@@ -149,41 +215,70 @@ class App(object):
                                     setDisplayMode=self.setDisplayMode, **KWARGS)
       self.regionFrame = RegionFrame(self.master, self.data.getMapMatrix(), **KWARGS)
       self.insetFrame = InsetFrame(self.master, self.data.getInsetMatrix(),
-                                   sendCommand=self.statusFrame.sendCommand, setRelDestination=self.setRelDestination, **KWARGS)
+                                   sendCommand=self.statusFrame.sendCommand, setRelDestination=self.setRelDestination,
+                                   setRelGoal=self.setRelGoal if PLAN_PATHS else None, **KWARGS)
       # pack frames
       self.statusFrame.pack(side='bottom', fill='x')
       self.regionFrame.pack(side='left', fill='both', expand=True)
       self.insetFrame.pack(side='right', fill='both', expand=True)
 
+    if MAP_SERVER: self.mapServer = MapServer(MAP_SERVER_HOST, MAP_SERVER_PORT) # hashes and encodes tiles on its own threads
+
     # Start loops
     self.serThread.start() # begin fetching data from serial port and processing it
-    self.updateData() # pull data from queue, put into data matrix
-    self.updateMap() # draw new data matrix
-    self.statusFrame.autosendCommand() # check for user input and automatically send it
+    self.saver.start() # wait for map snapshots to write
+    if FAST_MAPPING: self.renderThread.start() # draw map snapshots as they come
+    if MAP_SERVER: self.mapServer.start() # serve map tiles to browsers
+    if EXPLORE and PLAN_PATHS: self.explorer.start() # wait for map snapshots to pick frontiers from
+    if HEADLESS: self.master.after(1000*SNAPSHOT_PERIOD, self.saveSnapshot)
+    # from here on, each scan from the serial thread is processed as it arrives, and redraws the map
 
   def closeWin(self):
     self.paused = True
     self.statusStr.set(paddedStr("Paused.", len(self.statusStr.get())))
-    if askokcancel("Quit?", "Are you sure you want to quit?"):
+    if HEADLESS or askokcancel("Quit?", "Are you sure you want to quit?"): # nobody to ask when HEADLESS
       self.statusStr.set(paddedStr("Stopping.", len(self.statusStr.get())))
       print("Shutting down LIDAR")
       self.serThread.stop() # tell serial thread to stop running
+      self.explorer.stop()
+      if FAST_MAPPING: self.renderThread.stop()
+      if MAP_SERVER: self.mapServer.stop()
+      self.saver.stop()
+      self.saver.join(10.0) # let any save in progress finish
       print("Closing program")
       self.master.quit() # kills interpreter (necessary for some reason)
-    else: self.paused = False
-
-  def restartAll(self, funcStep=0): # two-part initialization to be re-done at soft reset
-    if funcStep == 0:
-      self.restarting = True # stop currently running loops
-      self.master.after(2000, lambda: self.restartAll(funcStep=1)) # let processor wrap things up elsewhere # should be smarter
-      return
-    elif funcStep == 1:
-      with self.RXQueue.mutex: self.RXQueue.queue.clear() # empty incoming data queue
-      self.data = DataMatrix(**KWARGS)
-      self.slam = Slam(self.robot, self.laser, **KWARGS)
-      self.restarting = False
-      self.updateData() # pull data from queue, put into data matrix
-      self.updateMap() # draw new data matrix
+    else:
+      self.paused = False
+      self.updateData() # catch up on scans that came in while asking
+
+  def restartAll(self): # initialization to be re-done at soft reset
+    self.restarting = True # scans wait, and the map isn't drawn, until the new objects are made
+    self.statusStr.set(paddedStr("Restarting...", len(self.statusStr.get())))
+    if not self.explorer.pending: self.finishRestart() # otherwise explorerDone finishes once the old map's pick is back
+
+  def finishRestart(self):
+    self.explorer.getGoal() # throw away any goal picked from the old map
+    with self.RXQueue.mutex: self.RXQueue.queue.clear() # empty incoming data queue
+    self.data = DataMatrix(**KWARGS)
+    self.slam = Slam(self.robot, self.laser, **KWARGS)
+    self.visitedGoals, self.exploreGoal = [], None
+    self.dataInit = True # the next scan may be partial, since the queue was cleared mid-scan
+    self.restarting = False
+
+  def explorerDone(self): # the exploration thread picked a goal, which explore takes on the next map update
+    if self.restarting: self.finishRestart()
+
+  def onSerial(self, event):
+    if event == 'scan': self.post(self.updateData) # posted before a restart, this finds the queue cleared, and does nothing
+    elif event == 'status': self.post(self.showStatus)
+    elif event == 'ack' and not HEADLESS: self.post(self.statusFrame.ackReceived)
+
+  def showStatus(self):
+    status = None
+    while True: # only the newest is worth showing
+      try: status = self.statusQueue.get_nowait()
+      except QueueEmpty: break
+    if status is not None and not self.paused: self.statusStr.set(paddedStr(status, len(self.statusStr.get())))
 
   def setDisplayMode(self, *args, **kwargs):
     return self.data.setDisplayMode(*args, **kwargs)
@@ -191,69 +286,128 @@ class App(object):
   def setRelDestination(self, *args, **kwargs):
     return self.data.setRelDestination(*args, **kwargs)
 
-  def saveImage(self): # function prototype until data is initialized
-    self.paused = True
-    self.statusStr.set(paddedStr("Saving image. Close to resume.", len(self.statusStr.get()))) # keep length of label constant
-    self.master.update() # force statusStr update
-    self.updateMap(loop=False) # make sure we save the newest map
-    self.data.saveImage()
-    self.paused = False
+  def setRelGoal(self, *args, **kwargs):
+    return self.data.setRelGoal(*args, **kwargs)
+
+  def sendWaypoint(self, relDestination): # same command as clicking on the inset map without PLAN_PATHS
+    x, y = relDestination[0:2]
+    self.statusFrame.sendCommand('c{0:0.1f}c{1:0.0f}'.format(degrees(atan2(x,y)), (x**2 + y**2)**0.5))
+
+  def explore(self):
+    if self.data.goal is not None: # still driving to the last goal
+      if self.data.goal is not self.exploreGoal: return # clicked on the inset map, so it's up to the user
+      unreachable = self.data.failedPlans >= MAX_FAILED_PLANS # visitedGoals keeps it from being picked again
+      if not unreachable and not frontierCleared(self.data.updateFeatures(), self.visitedGoals[-1]): return
+      self.data.clearGoal() # its frontier was explored on the way, or there's no way there, so pick another
+    goal = self.explorer.getGoal()
+    if goal is not None:
+      self.visitedGoals.append(goal)
+      self.data.setGoalCell(goal) # updatePlan plans the way there and sends the waypoints
+      self.exploreGoal = self.data.goal
+    elif not self.explorer.pending: # path costs to every frontier take ~6ms, so leave them to the exploration thread
+      self.explorer.request(*self.data.getExploreSnapshot(), visited=self.visitedGoals)
+
+  def renderRegion(self, frame):
+    mapMatrix, robotAbs, trajectory = frame
+    if self.regionFrame is None:
+      from slambotgui.cvslamshow import SlamShow # OpenCV loads here on the render thread, while the Tk window starts up
+      self.regionFrame = SlamShow(CV_IMG_SIZE, CV_IMG_RES_PIX_PER_MM, 'SLAM Rover: Hit ESC to quit')
+    self.regionFrame.displayMap(self.regionResizer.resize(mapMatrix)) # 3ms
+    self.regionFrame.displayTrajectory(trajectory) # only draws the path since the last frame into its layer
+    self.regionFrame.displayRobot(robotAbs)
+    self.regionImage = self.regionFrame.image.copy() # the next frame is drawn into the same image
+    self.post(self.showRegion) # HighGUI isn't thread-safe on every backend (Qt and Cocoa need the main thread)
+
+  def showRegion(self): # shows the newest frame from renderRegion, on the main thread
+    image, self.regionImage = self.regionImage, None
+    if image is None: return # already shown, by the post of a later frame
+    if self.regionFrame.refresh(image) == 27: self.closeWin() # ESC key pressed
+
+  def saveImage(self, view=not HEADLESS): # snapshots the map, and writes it on the save thread
+    if self.dataInit: return # nothing mapped yet
+    self.updateMap() # make sure we save the newest map
+    snapshot = self.data.getSnapshot() # copies, so the map can keep changing while the file is written
+    self.statusStr.set(paddedStr("Saving image...", len(self.statusStr.get()))) # keep length of label constant
+    self.saver.submit(lambda: writeSnapshot(snapshot, SAVE_FORMAT), lambda filepath, error: self.imageSaved(filepath, error, view))
+    data = self.data # not whatever restartAll may replace it with
+    if EXPORT_TILES: self.saver.submit(lambda: data.exportTiles(mapMatrix=snapshot['map'])) # only rewrites tiles changed since the last save
+
+  def imageSaved(self, filepath, error, view): # called back from the save thread's results, on the main thread
+    if error is not None: self.statusStr.set(paddedStr("Couldn't save image: " + str(error), len(self.statusStr.get())))
+    else:
+      self.statusStr.set(paddedStr("Image saved to " + filepath, len(self.statusStr.get())))
+      if view and SAVE_FORMAT == 'png': viewImage(filepath)
 
   def getScanData(self, repeat=False):
-    self.points = [] # wipe old data before writing new data
+    points = [] # wipe old data before writing new data
     while True:
       # Make sure there's actually data to get
       try: queueItem = self.RXQueue.get_nowait()
       except QueueEmpty: # something's wrong
         self.statusStr.set(paddedStr("RXQueue empty. Send 'l' iff LIDAR stopped.", len(self.statusStr.get())))
-        return # stop because no data to read
+        repeat = False # stop because no data to read
+        break
       else:
         if isinstance(queueItem[0], float): # scan data
-          self.points.append(queueItem)
+          points.append(queueItem)
         elif isinstance(queueItem[1], int): # encoder data
-          self.slam.currEncPos = queueItem
+          self.slam.currEncPos = queueItem[0:3]
+          self.slam.currEncTime = queueItem[3]
           break # encoder data signals new scan
         else:
           print("RXQueue broken (something weird happened...)")
+    scan = np.array(points, dtype=float).reshape(-1,3)
+    self.points, self.pointTimes = scan[:,0:2], scan[:,2] # distance, angle pairs and when they arrived
     if repeat: self.getScanData()
 
-  def updateData(self, init=True):
-    self.dataInit = init
-    if not self.paused:
-      try: status = self.statusQueue.get_nowait() # do this before anything else
-      except QueueEmpty: pass
-      else: self.statusStr.set(paddedStr(status, len(self.statusStr.get())))
-
-      if self.RXQueue.qsize() > (2 if init else 1)*NUM_SAMP: # ready to pull new scan data
-        # pull data from serial thread via RXQueue, ignoring the first scan, which is incomplete
-        self.getScanData(repeat=init) # 2ms
-
-        # update robot position
-        if init: self.slam.prevEncPos = self.slam.currEncPos # set both values the first time through
-        self.data.getRobotPos(self.slam.updateSlam(self.points), init=init) # send data to slam to do stuff # 15ms
-
-        self.data.drawPointMap(self.points) # draw map using scan points
-
-        if init: init = False # initial data gathered successfully
-
-    if not self.restarting: self.master.after(DATA_RATE, lambda: self.updateData(init=init))
-    else: self.statusStr.set(paddedStr("Restarting...", len(self.statusStr.get()))) # if loop ends, we're restarting
-
-  def updateMap(self, loop=True):
-    if not self.paused and not self.dataInit: # wait until first data update to update map
-      # draw map using slam data # 16ms
-      self.data.drawBreezyMap(self.slam.getBreezyMap())
-
-      self.data.drawInset() # new relative map # 7ms
+  def scansQueued(self): # the queue itself, rather than a separate count, so a restart clearing it can't leave them out of step
+    with self.RXQueue.mutex: return sum(1 for queueItem in self.RXQueue.queue if not isinstance(queueItem[0], float))
+
+  def updateData(self):
+    init = self.dataInit
+    scans = self.scansQueued()
+    if self.paused or self.restarting or scans < (2 if init else 1): return # the first scan is incomplete
+    # pull data from serial thread via RXQueue, ignoring the first scan, which is incomplete
+    self.getScanData(repeat=init) # 2ms
+
+    # update robot position
+    if init: self.slam.prevEncPos, self.slam.prevEncTime = self.slam.currEncPos, self.slam.currEncTime # set both the first time
+    self.points = self.slam.deskewScan(self.points, self.pointTimes) # undo robot motion during scan
+    self.data.getRobotPos(self.slam.updateSlam(self.points), init=init) # send data to slam to do stuff # 15ms
+
+    self.data.drawPointMap(self.points) # draw map using scan points
+    self.dataInit = False # initial data gathered successfully
+    self.requestMap()
+    if scans > (2 if init else 1): self.post(self.updateData) # fell behind, so catch up, letting Tk handle events in between
+
+  def requestMap(self):
+    if self.mapRequested: return
+    self.mapRequested = True
+    self.master.after(max(int(1000*(self.lastMapTime - time.time())) + MAP_RATE, 0), self.updateMap)
+
+  def updateMap(self):
+    self.mapRequested = False
+    if self.paused or self.dataInit or self.restarting: return # wait until first data update to update map
+    self.lastMapTime = time.time()
+    # draw map using slam data # 16ms
+    self.data.drawBreezyMap(self.slam.getBreezyMap())
+    if EXPLORE and PLAN_PATHS: self.explore() # pick a new goal once the last one is reached
+    if PLAN_PATHS: # repair path to goal with the new map, and drive to the next waypoint if it changed
+      waypoint = self.data.updatePlan()
+      if waypoint: self.sendWaypoint(waypoint)
+    if MAP_SERVER: self.mapServer.publish(*self.data.getMapSnapshot()) # browsers are sent the tiles that changed
+
+    if not HEADLESS: # no display when HEADLESS, so saveSnapshot just saves the map every so often
+      self.data.drawInset() # new relative map # 2ms
       self.insetFrame.updateMap(self.data.get_robot_rel(), self.data.getRelDestination(), self.data.getInsetMatrix()) # 25ms
       if FAST_MAPPING:
-        self.regionFrame.displayMap(self.data.getMapArray((CV_IMG_SIZE,CV_IMG_SIZE))) # 36ms
-        self.regionFrame.displayRobot(self.data.get_robot_abs())
-        if self.regionFrame.refresh() == 27: self.closeWin() # ESC key pressed
+        self.renderThread.submit((self.data.getMapMatrix().copy(), self.data.get_robot_abs(), self.data.get_trajectory_abs())) # snapshot, drawn on the render thread
       else:
         self.regionFrame.updateMap(self.data.get_robot_rel(), self.data.getDestination(), self.data.getMapMatrix())
-    if loop and not self.restarting: self.master.after(MAP_RATE, self.updateMap)
 
+  def saveSnapshot(self):
+    self.saveImage()
+    self.master.after(1000*SNAPSHOT_PERIOD, self.saveSnapshot)
 
 if __name__ == '__main__':
   print(GPL)
@@ -23,6 +23,7 @@ This is free software, and you are welcome to redistribute it \n\
 under certain conditions; please cite the source."
 
 import sys, os, time
+import numpy as np
 print("Python {}.{}.{}".format(*sys.version_info[0:3]))
 
 # used in Root class
@@ -42,6 +43,8 @@ from slambotgui.components import DaguRover5, RPLIDAR
 INTERNAL_MAP = False
 SMARTNESS_ON = True
 FAST_MAPPING = True
+SAVE_FORMAT = 'png' # map file to save: 'png' image with the robot's path, plain 'pgm' map, or compressed numpy 'npz' of it all
+EXPORT_TILES = False # each time the map is saved, also update a zoomable tile pyramid of it in tiles/ (for very large maps)
 logFileDirectory = ['examples'] # leave as empty string in list for current directory
 logFileName = 'data_6AUG14_16m.log'
 if FAST_MAPPING: from slambotgui.cvslamshow import SlamShow # uses OpenCV
@@ -49,6 +52,10 @@ if FAST_MAPPING: from slambotgui.cvslamshow import SlamShow # uses OpenCV
 # SLAM preferences
 USE_ODOMETRY = True
 MAP_QUALITY = 7
+SEARCH_SCORE_THRESHOLD = -1 # stop scan matching once scan-to-map distance is this low (lower is better), -1 for never
+SEARCH_MIN_SIGMA_XY_MM = 0 # stop scan matching once search has narrowed below this position spread [mm], 0 for never # off so replays match the full search
+SEARCH_MIN_SIGMA_THETA_DEG = 0 # stop scan matching once search has narrowed below this heading spread [deg], 0 for never # off so replays match the full search
+SEARCH_TIME_US = 0 # wall-clock budget for each scan match [us], 0 for none # unlimited so replays are repeatable
 
 # GUI constants
 DATA_RATE = 1 # minimum time between updating data from lidar [ms] # can't be 0
@@ -58,6 +65,11 @@ MAP_RATE = 200 # minimum time between updating map [ms]
 DIST_MIN = 100; # minimum distance
 DIST_MAX = 6000; # maximum distance
 
+# Scan constants
+SCAN_BINS = 360 # angular bins per scan (360 is 1deg, 720 is 0.5deg, 1440 is 0.25deg) # logs store one distance per bin
+SCAN_AGGREGATE = 'min' # how to combine points in the same bin: 'last', 'min' or 'median'
+SCAN_GAP_BINS = 2 # longest run of empty bins to fill by interpolation, 0 for none
+
 # Map constants
 MAP_SIZE_M = 16.0 # size of region to be mapped [m]
 INSET_SIZE_M = 2.0 # size of relative map
@@ -68,7 +80,9 @@ CV_IMG_RES_PIX_PER_MM = CV_IMG_SIZE/MAP_SIZE_M/1000 # number of pixels of data p
 MAP_DEPTH = 5 # depth of data points on map (levels of certainty)
 print("Each pixel is " + str(round(1000.0/MAP_RES_PIX_PER_M,1)) + "mm, or " + str(round(1000.0/MAP_RES_PIX_PER_M/25.4,2)) + "in.")
 
-KWARGS_keys = ['MAP_SIZE_M','INSET_SIZE_M','MAP_RES_PIX_PER_M','MAP_DEPTH','INTERNAL_MAP','SMARTNESS_ON','USE_ODOMETRY','MAP_QUALITY']
+KWARGS_keys = ['MAP_SIZE_M','INSET_SIZE_M','MAP_RES_PIX_PER_M','MAP_DEPTH','INTERNAL_MAP','SMARTNESS_ON','USE_ODOMETRY','MAP_QUALITY',
+               'SEARCH_SCORE_THRESHOLD','SEARCH_MIN_SIGMA_XY_MM','SEARCH_MIN_SIGMA_THETA_DEG','SEARCH_TIME_US',
+               'SCAN_AGGREGATE','SCAN_GAP_BINS']
 
 def main():
   root = Tk() # create tkinter window
@@ -101,7 +115,7 @@ class App(object):
 
     # physical objects
     self.robot = DaguRover5()
-    self.laser = RPLIDAR(DIST_MIN, DIST_MAX)
+    self.laser = RPLIDAR(DIST_MIN, DIST_MAX, SCAN_BINS)
 
     # get data from log file
     self.logFileIndex = 0
@@ -168,17 +182,19 @@ class App(object):
 
   def saveImage(self, step=0): # function prototype until data is initialized
     self.paused = True
-    self.statusStr.set(paddedStr("Saving image. Close to resume.", len(self.statusStr.get()))) # keep length of label constant
+    self.statusStr.set(paddedStr("Saving image...", len(self.statusStr.get()))) # keep length of label constant
     self.master.update() # force statusStr update
     self.updateMap(loop=False) # make sure we save the newest map
-    self.data.saveImage()
+    self.data.saveImage(format=SAVE_FORMAT) # log replay waits for the save, so it needs no thread
+    if EXPORT_TILES: self.data.exportTiles() # only rewrites tiles changed since the last save
     self.paused = False
 
   def getScanData(self):
     scan = self.logFileContents[self.logFileIndex]
 
     self.slam.currEncPos = scan[0:3]
-    self.points = zip(scan[3:], range(self.laser.SCAN_SIZE)) # distance, angle tuples
+    numBins = len(scan) - 3 # log may have been recorded at a different resolution than we're binning at
+    self.points = np.column_stack((scan[3:], np.arange(numBins)*360.0/numBins)) # distance, angle pairs
 
     self.logFileIndex += 1
 
@@ -209,10 +225,11 @@ class App(object):
       # draw map using slam data # 16ms
       self.data.drawBreezyMap(self.slam.getBreezyMap())
 
-      self.data.drawInset() # new relative map # 7ms
+      self.data.drawInset() # new relative map # 2ms
       self.insetFrame.updateMap(self.data.get_robot_rel(), self.data.getRelDestination(), self.data.getInsetMatrix()) # 25ms
       if FAST_MAPPING:
-        self.regionFrame.displayMap(self.data.getMapArray((CV_IMG_SIZE,CV_IMG_SIZE))) # 36ms
+        self.regionFrame.displayMap(self.data.getMapArray((CV_IMG_SIZE,CV_IMG_SIZE))) # 3ms
+        self.regionFrame.displayTrajectory(self.data.get_trajectory_abs())
         self.regionFrame.displayRobot(self.data.get_robot_abs())
         if self.regionFrame.refresh() == 27: self.closeWin() # ESC key pressed
       else:
@@ -1 +1 @@
-__all__ = ["components", "guis", "comms", "dataprocessing", "tools", "slams", "cvslamshow"]
\ No newline at end of file
+__all__ = ["components", "guis", "comms", "dataprocessing", "frontiers", "costmaps", "exploration", "rendering", "mapserver", "saving", "tools", "slams", "cvslamshow"]
\ No newline at end of file
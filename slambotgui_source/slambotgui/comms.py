@@ -57,12 +57,17 @@ class SerialThread(Thread):
   # getACK returns whether we have received an ACK from the Arduino
   # resetACK resets boolean indicating that Arduino has received a command
   # run is the main loop, which handles all serial communication
+  #     scan points are queued as (distance [mm], angle [deg], receive time [s])
+  #     encoder packets are queued as (left [ticks], right [ticks], timestamp [ms], receive time [s])
+  #     notify is called (on this thread) with 'scan' once each scan's encoder packet is queued, 'status' once each status is,
+  #     and 'ack' when an ACK arrives, so root can wait for these instead of checking the queues
 
-  def __init__(self, laser, statusQueue, RXQueue, TXQueue):
+  def __init__(self, laser, statusQueue, RXQueue, TXQueue, notify=None):
     super(SerialThread, self).__init__() # nicer way to initialize base class (only works with new-style classes)
     self.statusQueue = statusQueue
     self.RXQueue = RXQueue
     self.TXQueue = TXQueue
+    self.notify = notify if notify is not None else lambda event: None
     self.distMin = laser.DIST_MIN
     self.distMax = laser.DIST_MAX
 
@@ -168,22 +173,26 @@ class SerialThread(Thread):
       pointLine = self.ser.read(PKT_SIZE) # distance and angle (blocking)
       if len(pointLine) < PKT_SIZE: # timeout occurs
         self.statusQueue.put("ser.read() timeout. Send 'l' iff LIDAR stopped.")
+        self.notify('status')
         continue # try again
 
       if time() > tstart + 1.0: # report status of serial thread to root every second
         tstart += 1.0
         self.statusQueue.put("{:4} lagged, {:2} errors in {:4} points, {:2} scans.".format(lagged,missed,total,scans))
+        self.notify('status')
         lagged, missed, total, scans = 0,0,0,0
 
       # check for command ACK
       if pointLine == ENC_FLAG*PKT_SIZE:
         self.gotACK = True # ACK from Arduino
+        self.notify('ack')
         continue # move to the next point
 
       # check for encoder data packet
       if pointLine[0:2] == ENC_FLAG*2:
         pointLine += self.ser.read(ENC_SIZE-PKT_SIZE) # read more bytes to complete longer packet
-        self.RXQueue.put(unpack('<2hH',pointLine[2:])) # little-endian 2 signed shorts, 1 unsigned short
+        self.RXQueue.put(unpack('<2hH',pointLine[2:]) + (time(),)) # little-endian 2 signed shorts, 1 unsigned short
+        self.notify('scan') # encoder data ends each scan
         scans += 1
         continue # move to the next point
 
@@ -193,7 +202,7 @@ class SerialThread(Thread):
         distCurr = (byte1 | (byte2 & MASK1) << 8)/DFAC # 12 least-significant (sent first) bytes12 bits
         angleCurr = (byte3 << 4 | (byte2 & MASK2) >> 4)/AFAC # 4 most-significant (sent last) bytes2 bits, 8 byte1 bits
         if self.distMin < distCurr < self.distMax and 0 <= angleCurr <= 360: # data matches what was transmitted
-          self.RXQueue.put((distCurr, angleCurr))
+          self.RXQueue.put((distCurr, angleCurr, time())) # receive time used to deskew scan
           total += 1
         else: # invalid point received (communication error)
           while self.ser.read(1) != SCN_FLAG: pass # delete current packet up to and including SCN_FLAG byte
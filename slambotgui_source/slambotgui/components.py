@@ -88,13 +88,14 @@ class DaguRover5(TrackedRobot):
 from breezyslam.components import Laser
 
 class RPLIDAR(Laser):
-  def __init__(self, DIST_MIN, DIST_MAX):
+  def __init__(self, DIST_MIN, DIST_MAX, SCAN_SIZE=360):
     self.DIST_MIN = DIST_MIN
     self.DIST_MAX = DIST_MAX
 
-    self.SCAN_SIZE = 360 # number of points per scan
+    self.SCAN_SIZE = SCAN_SIZE # number of angular bins per scan (360 is 1deg bins, 720 is 0.5deg, 1440 is 0.25deg)
     POINTS_PER_SEC = 1980 # 1980points/sec * scan/360points [scans/sec]
-    self.SCAN_RATE_HZ = float(POINTS_PER_SEC)/self.SCAN_SIZE # 1980points/sec * scan/360points [scans/sec]
+    POINTS_PER_SCAN = 360 # roughly one point per degree, regardless of how finely we bin them
+    self.SCAN_RATE_HZ = float(POINTS_PER_SEC)/POINTS_PER_SCAN # 1980points/sec * scan/360points [scans/sec]
     SCAN_DETECTION_ANGLE = 360
     SCAN_DISTANCE_NO_DETECTION_MM = self.DIST_MAX
     SCAN_DETECTION_MARGIN = 0
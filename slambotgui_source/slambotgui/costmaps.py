@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# costmaps.py - obstacle clearance costs for path planning, from a distance transform of the map
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from tools import ROBOT_WIDTH, ROBOT_HEIGHT, LETHAL_COST, INSCRIBED_COST
+import numpy as np
+
+INFLATION_RADIUS_MM = 500 # distance from obstacles beyond which there is no cost [mm]
+COST_DECAY_MM = 100 # distance over which cost outside the footprint falls by a factor of e [mm]
+
+
+class CostMap(object):
+  # init         sets the cost zones from the robot footprint, for a square grid of cells
+  # getCost      returns the cost of cells at the given distances from the nearest obstacle
+  # update       recomputes the distance transform and costs near obstacle cells that changed (or everywhere)
+  # takeChanges  returns the (rows, cols) of cells whose cost changed since the last call, for planners
+  # getDisplay   returns the costs as a map, bright where free and dark where lethal
+
+  def __init__(self, size, cellSize_mm, inflation_mm=INFLATION_RADIUS_MM, decay_mm=COST_DECAY_MM):
+    self.size = size
+    self.cellSize = float(cellSize_mm) # [mm]
+    self.inscribed = 1000*min(ROBOT_WIDTH, ROBOT_HEIGHT)/2 # robot center closer than this to an obstacle collides [mm]
+    self.circumscribed = 1000*np.hypot(ROBOT_WIDTH, ROBOT_HEIGHT)/2 # robot center closer than this might collide [mm]
+    self.inflation = max(inflation_mm, self.circumscribed) # [mm]
+    self.decay = decay_mm
+    self.reach = int(np.ceil(self.inflation/self.cellSize)) # cells an obstacle change can affect the cost of
+
+    self.distance = np.empty((size, size), dtype=np.float32) # distance from each cell to the nearest obstacle [mm]
+    self.distance.fill(np.inf)
+    self.costs = np.zeros((size, size), dtype=np.uint8) # 0 free, up to LETHAL_COST
+    self.changed = np.zeros((size, size), dtype=bool) # cells whose cost changed since last taken
+    self.initialized = False
+
+  def getCost(self, distance):
+    decayed = (INSCRIBED_COST-1)*np.exp(-(distance - self.circumscribed)/self.decay) # falls off outside the footprint
+    return np.where(distance < self.inscribed, LETHAL_COST,
+             np.where(distance < self.circumscribed, INSCRIBED_COST,
+               np.where(distance < self.inflation, np.maximum(decayed, 1), 0))).astype(np.uint8)
+
+  def update(self, obstacles, rows=None, cols=None): # rows, cols are the obstacle cells that changed, or None for all
+    if rows is None or not self.initialized:
+      r0, r1, c0, c1 = 0, self.size, 0, self.size
+      self.initialized = True
+    elif len(rows) == 0: return False
+    else: # cells within reach of a changed obstacle cell
+      r0, r1 = max(rows.min() - self.reach, 0), min(rows.max() + 1 + self.reach, self.size)
+      c0, c1 = max(cols.min() - self.reach, 0), min(cols.max() + 1 + self.reach, self.size)
+
+    # obstacles within reach of the region are all that can affect its costs
+    R0, R1, C0, C1 = max(r0 - self.reach, 0), min(r1 + self.reach, self.size), max(c0 - self.reach, 0), min(c1 + self.reach, self.size)
+    window = obstacles[R0:R1, C0:C1]
+    from scipy.ndimage import distance_transform_edt # scipy loads when costs are first needed, not at startup
+    if window.any(): distance = self.cellSize*distance_transform_edt(~window)[r0-R0:r1-R0, c0-C0:c1-C0]
+    else: distance = np.inf*np.ones((r1-r0, c1-c0)) # no obstacles nearby, so no cost (the transform needs one)
+    costs = self.getCost(distance)
+    self.changed[r0:r1, c0:c1] |= costs != self.costs[r0:r1, c0:c1]
+    self.costs[r0:r1, c0:c1] = costs
+    self.distance[r0:r1, c0:c1] = distance
+    return True
+
+  def takeChanges(self):
+    changes = np.nonzero(self.changed)
+    self.changed[:] = False
+    return changes
+
+  def getDisplay(self):
+    return 255 - self.costs
@@ -45,10 +45,12 @@ SENSOR_NEGATIVE_COLOR_BGR       = (0,0,255)
 # Trajectory display params
 TRAJECTORY_COLOR_BGR            = (255, 0, 0)
 
-import cv
+import cv2
+import numpy as np
+from tools import GrowingArray
 
 # Arbitrary font for OpenCV
-FONT_FACE                       = cv.CV_FONT_HERSHEY_COMPLEX
+FONT_FACE                       = cv2.FONT_HERSHEY_COMPLEX
 
 from math import sin, cos, radians
 
@@ -61,58 +63,53 @@ class SlamShow(object):
         self.map_scale_pixels_per_mm = map_scale_pixels_per_mm
         self.window_name = window_name
 
-        # Create a byte array to display the map with a color overlay
-        self.bgrbytes = bytearray(map_size_pixels * map_size_pixels * 3)
+        # Create the color image that the map is displayed in, with color overlays drawn on it
+        self.image = np.zeros((map_size_pixels, map_size_pixels, 3), dtype=np.uint8)
         
-        # Create an empty OpenCV image to be filled with map bytes
-        self.image = cv.CreateImageHeader((map_size_pixels,map_size_pixels), cv.IPL_DEPTH_8U, 3)
-    
-        # Create an OpenCV window for displaying the map
-        cv.NamedWindow(window_name, cv.CV_WINDOW_AUTOSIZE)
+        # Pixel offsets of the ring drawn around each scan point
+        ring = [(dx, dy) for dx in range(-SCANPOINT_RADIUS, SCANPOINT_RADIUS+1) for dy in range(-SCANPOINT_RADIUS, SCANPOINT_RADIUS+1)
+                if int(round((dx**2 + dy**2)**0.5)) == SCANPOINT_RADIUS]
+        self.scan_ring = np.array(ring, dtype=np.intp).reshape(-1, 1, 2)
         
-        # Set up font for displaying velocities
-        self.font = cv.InitFont(FONT_FACE, 1, 1)
+        # Trajectory layer: each segment is rasterized once, and its pixels are pasted over every new map
+        self.trajectory_layer = np.zeros((map_size_pixels, map_size_pixels), dtype=np.uint8)
+        self.trajectory_pixels = GrowingArray(dtype=np.intp) # flat indices of the pixels set in the layer
+        self.trajectory_drawn = 0 # number of trajectory points already in the layer
     
-        # Display initial empty image
-        cv.SetData(self.image, self.bgrbytes, self.map_size_pixels*3)
-        cv.ShowImage(self.window_name, self.image)
+        # The OpenCV window is created by the first refresh, on the thread that shows it (Qt and Cocoa need the main thread)
+        self.window_created = False
 
 
-    def displayMap(self, mapbytes):
-        
-        # Interleave the grayscale map bytes into the color bytes
-        self.bgrbytes[0::3] = mapbytes
-        self.bgrbytes[1::3] = mapbytes
-        self.bgrbytes[2::3] = mapbytes
+    def displayMap(self, maparray):
         
-        # Put color bytes into image
-        cv.SetData(self.image, self.bgrbytes, self.map_size_pixels*3)
+        # Copy the grayscale map array into all three color channels of the image, in place
+        cv2.cvtColor(maparray, cv2.COLOR_GRAY2BGR, dst=self.image)
  
  
     def displayRobot(self, (x_mm, y_mm, theta_deg), scale=1, color=ROBOT_COLOR_BGR, line_thickness=1):
                         
         # Get a polyline (e.g. triangle) to represent the robot icon
-        robot_points = self.robot_polyline(scale)
+        robot_points = np.array(self.robot_polyline(scale), dtype=float)
         
-        # Rotate the polyline by the current angle
-        robot_points = map(lambda pt: rotate(pt, -theta_deg), robot_points)
-                        
-        # Move the polyline to the current robot position
-        robot_points = map(lambda pt: (x_mm+pt[0], y_mm+pt[1]), robot_points)
+        # Rotate the polyline by the current angle, and move it to the current robot position
+        c, s = cos(radians(-theta_deg)), sin(radians(-theta_deg))
+        robot_points = robot_points.dot([[c, s], [-s, c]]) + (x_mm, y_mm)
         
         # Convert the robot position from meters (up is positive) to pixels (down is positive)
-        robot_points = map(lambda pt: (self.mm2pix(pt[0]), self.map_size_pixels-self.mm2pix(pt[1])), robot_points)
+        robot_points = self.mm2pix(robot_points)
+        robot_points[:,1] = self.map_size_pixels - robot_points[:,1]
         
         # Add an icon for the robot
-        cv.PolyLine(self.image, [robot_points], True, color, line_thickness) 
+        cv2.polylines(self.image, [robot_points.reshape(-1, 1, 2)], True, color, line_thickness)
 
 
     def displayScan(self, scan, offset_mm = (0,0), color=SCANPOINT_COLOR_BGR):
    
-       for point in scan:
-           cv.Circle(self.image, \
-                     (self.mm2pix(point[0]+offset_mm[0]), self.mm2pix(point[1]+offset_mm[1])), \
-                     SCANPOINT_RADIUS, color)
+        # Paint the ring of pixels around every point at once, skipping any that fall off the image
+        points = self.mm2pix(np.asarray(scan, dtype=float).reshape(-1, 2)[:,0:2] + offset_mm)
+        pixels = (points + self.scan_ring).reshape(-1, 2)
+        pixels = pixels[((pixels >= 0) & (pixels < self.map_size_pixels)).all(axis=1)]
+        self.image[pixels[:,1], pixels[:,0]] = color
       
                
     def displayVelocities(self, dxy_mm, dtheta_deg):
@@ -121,26 +118,48 @@ class SlamShow(object):
         self.show_velocity(dxy_mm,      SENSOR_V_MAX_MM,      '   dXY', SENSOR_V_Y)
         self.show_velocity(dtheta_deg,  SENSOR_THETA_MAX_DEG, 'dTheta', SENSOR_THETA_Y)
                        
+    # Draws the path through every (x_mm, y_mm) the robot has been at, like displayRobot's position, in an array that only grows
     def displayTrajectory(self, trajectory):
         
-        for k in range(1, len(trajectory)):
-            
-            x1_mm, y1_mm = trajectory[k-1]
-            x2_mm, y2_mm = trajectory[k]
+        # Start over if the trajectory is shorter than what was drawn (it was reset)
+        if len(trajectory) < self.trajectory_drawn:
+            self.trajectory_layer[:] = 0
+            self.trajectory_pixels = GrowingArray(dtype=np.intp)
+            self.trajectory_drawn = 0
+        
+        # Rasterize only the segments added since the last frame, starting from the last point drawn
+        first = max(self.trajectory_drawn - 1, 0)
+        if len(trajectory) - first >= 2:
+            points = self.mm2pix(np.asarray(trajectory[first:], dtype=float))
+            points[:,1] = self.map_size_pixels - points[:,1] # up is positive in mm, down in pixels
+            x0, y0 = np.maximum(points.min(axis=0), 0)
+            x1, y1 = points.max(axis=0) + 1
+            region = self.trajectory_layer[y0:y1, x0:x1]
+            before = region.copy()
+            cv2.polylines(self.trajectory_layer, [points.reshape(-1, 1, 2)], False, 1)
             
-            cv.Line(self.image, 
-                (self.mm2pix(x1_mm), self.mm2pix(y1_mm)), \
-                (self.mm2pix(x2_mm), self.mm2pix(y2_mm)), \
-                TRAJECTORY_COLOR_BGR)
+            # Keep just the pixels that turned on, so each is pasted once
+            rows, cols = np.nonzero(region > before)
+            self.trajectory_pixels.extend((rows + y0)*self.map_size_pixels + cols + x0)
+            self.trajectory_drawn = len(trajectory)
+        
+        # Paste the layer over the map
+        self.image.reshape(-1, 3)[self.trajectory_pixels.view()] = TRAJECTORY_COLOR_BGR
                 
-    def refresh(self):                   
-                       
+    # Shows the image drawn, or a copy of it, so the next one can be drawn on another thread while this one is shown
+    def refresh(self, image=None):
+        
+        # Create the window the first time
+        if not self.window_created:
+            cv2.namedWindow(self.window_name, cv2.WINDOW_AUTOSIZE)
+            self.window_created = True
+        
         # Display image
-        cv.ShowImage(self.window_name, self.image)
+        cv2.imshow(self.window_name, self.image if image is None else image)
                                          
         # Force image display, returning any key hit
         key = cvdisplay()
-        return key if key > -1 else None
+        return key & 0xFF if key > -1 else None # some builds set modifier bits above the key code
      
 
     def waitkey(self, action):
@@ -160,13 +179,13 @@ class SlamShow(object):
         
     # Puts text in the image to label the velocity display
     def show_velocity(self, value, valspan, label, y):
-        cv.PutText(self.image, label+':', (SENSOR_TEXT_X, y), self.font, SENSOR_LABEL_COLOR_BGR) 
+        cv2.putText(self.image, label+':', (SENSOR_TEXT_X, y), FONT_FACE, 1, SENSOR_LABEL_COLOR_BGR) 
         bar_x1 = SENSOR_BAR_X + SENSOR_BAR_MAX_HEIGHT
         bar_y1 = y + SENSOR_BAR_Y_OFFSET
         bar_x2 = bar_x1 + int(value / valspan * SENSOR_BAR_MAX_HEIGHT)
         bar_y2 = y - SENSOR_BAR_WIDTH + SENSOR_BAR_Y_OFFSET
         bar_color = SENSOR_NEGATIVE_COLOR_BGR if value < 0 else SENSOR_POSITIVE_COLOR_BGR
-        cv.Rectangle(self.image, (bar_x1, bar_y1), (bar_x2, bar_y2), bar_color, cv.CV_FILLED) 
+        cv2.rectangle(self.image, (bar_x1, bar_y1), (bar_x2, bar_y2), bar_color, -1) # negative thickness fills
 
 
     # Builds an array of points for a polyline representing the robot, pointing 
@@ -179,15 +198,16 @@ class SlamShow(object):
         ytop =  ROBOT_HEIGHT / 2 * scale
         return [(xrgt,ybot), (0,ytop), (xlft,ybot)]
                         
-    # Converts millimeters to pixels
+    # Converts millimeters to pixels, for numbers or arrays
     def mm2pix(self, mm):
+        if isinstance(mm, np.ndarray): return (mm * self.map_scale_pixels_per_mm).astype(np.int32)
         return int(mm * self.map_scale_pixels_per_mm)
                 
 # Helpers -------------------------------------------------------------        
         
 # Forces OpenCV image display, returning id of key it or -1 if none            
 def cvdisplay():
-    return cv.WaitKey(1)
+    return cv2.waitKey(1)
     
 # Rotates a point by a specified number of degrees
 def rotate(pt, deg):
@@ -18,31 +18,44 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-# note that DataMatrix.saveImage() imports PIL and subprocess for map image saving and viewing
-from tools import vecDiff, wrt, shrinkTo, radians, float2int, Feature
+from tools import vecDiff, wrt, radians, float2int, DStarLite, RotatedSampler, NearestResizer, GrowingArray
+from frontiers import FrontierMap, FeatureTable
+from costmaps import CostMap
+from saving import writeSnapshot, viewImage
 import time
 import numpy as np # for array processing and matplotlib display
-from scipy.ndimage.interpolation import rotate
-from scipy.ndimage.measurements import label, find_objects
-from scipy.misc import imresize
 
 
 class DataMatrix(object):
   # init            creates data matrix and information vectors for processing
   # getMapMatrix    returns the map matrix
+  # getMapArray     returns the map matrix resized for display, in a reused buffer
   # getInsetMatrix  returns the inset map matrix
+  # updateFeatures  brings the table of unexplored frontiers up to date with the map
+  # setRelGoal      sets where the path planner should drive to, relative to the robot
+  # setGoalCell     sets where the path planner should drive to, as a pixel of the reduced map
+  # clearGoal       stops the path planner driving anywhere
+  # getExploreSnapshot  returns copies of the maps ExplorationThread picks frontiers from
+  # updateCostMap   brings the obstacle clearance costs up to date with the map
+  # updatePlan      repairs the planned path to the goal and returns the next waypoint relative to the robot, if it changed
   # get_robot_rel   returns the robot's position in mm relative to where is started
+  # get_trajectory_abs  returns every absolute position of the robot in mm so far, as an (x, y) array
   # getRobotPos     populates robot position information needed by other methods of Data
   # drawBreezyMap   adds the BreezySLAM internal map to the map matrix
   # drawPointMap    adds scan data to map matrix
   # drawInset       adds scan data to inset matrix
   # drawRobot       adds robot position to data matrix, in the form of an arrow of red pixels
   # drawPath        draws portion of the robot's trajectory in the form of red dots on the desired object
-  # saveImage       uses PIL to write an image file from the data matrix
+  # getPathLayer    returns the trajectory up to the robot's current position, drawing only points added since the last call
+  # getSnapshot     copies the map, robot and path, for saving on another thread
+  # saveImage       writes an image or data file of the map (see saving.SAVE_FORMATS)
+  # exportTiles     updates a zoomable tile pyramid of the map in a directory, rewriting only tiles that changed
 
-  def __init__(self, MAP_SIZE_M=8.0, INSET_SIZE_M=2, MAP_RES_PIX_PER_M=100, MAP_DEPTH=5, INTERNAL_MAP=False, SMARTNESS_ON=False, **unused):
+  def __init__(self, MAP_SIZE_M=8.0, INSET_SIZE_M=2, MAP_RES_PIX_PER_M=100, MAP_DEPTH=5, INTERNAL_MAP=False, SMARTNESS_ON=False,
+               PLAN_PATHS=False, **unused):
     self.INTERNAL_MAP = INTERNAL_MAP # should we use the map which BreezySLAM uses?
     self.SMARTNESS_ON = SMARTNESS_ON # should we use both maps and do smart things?
+    self.PLAN_PATHS = PLAN_PATHS and SMARTNESS_ON # should we plan paths over the road map? (needs the smart maps)
     self.USE_BREEZY_MAP = SMARTNESS_ON or INTERNAL_MAP
     self.USE_POINT_MAP = SMARTNESS_ON or not INTERNAL_MAP
     self.mapIncr = 255/MAP_DEPTH # height of each certainty layer
@@ -55,16 +68,31 @@ class DataMatrix(object):
 
     if self.USE_BREEZY_MAP: self.breezyMap = 255*np.ones((self.mapSize_pix, self.mapSize_pix), dtype=np.uint8)
     if self.USE_POINT_MAP: self.pointMap = 255*np.ones((self.mapSize_pix, self.mapSize_pix), dtype=np.uint8)
-    self.insetMatrix = 255*np.ones((self.insetSize_pix, self.insetSize_pix), dtype=np.uint8)
-    self.trajectory = [] # robot location history, in pixels
+    self.insetSampler = RotatedSampler(self.insetSize_pix) # reuses its buffers, and pads past the map edges
+    self.insetMatrix = self.insetSampler.output # redrawn in place
+    self.mapResizers = {} # cached lookups and buffers for getMapArray, by output size
+    self.trajectory = GrowingArray(2, dtype=np.intp) # robot location history, as (x, y) pixels
+    self.trajectory_abs = GrowingArray(2) # robot location history, as absolute (x, y) [mm] like robot_abs
+    self.pathLayer = np.zeros((self.mapSize_pix, self.mapSize_pix), dtype=bool) # pixels of the trajectory drawn so far
+    self.pathDrawn = 0 # number of trajectory points already in pathLayer
+    self.tilePyramid = None # hashes of the last tile export, made by exportTiles
     self.robot_init = () # x [mm], y [mm], th [deg], defined from lower-left corner of map
     self.robot_abs = () # current robot location
     self.robot_rel = () # robot location relative to start position
     self.robot_pix = () # robot pixel location, relative to upper-left (0,0) of image matrix
     self.destination = None # absolute coordinates of current target [mm]
     self.displayMode = 0 # which map to display, set in RegionFrame
-    self.features = [] # list of all unexplored frontiers
+    self.features = FeatureTable(np.zeros((1,1), dtype=int), 0) # table of all unexplored frontiers
     self.minTargSize = 6 # minimum size of unexplored frontier to be considered
+    if self.SMARTNESS_ON:
+      self.frontiers = FrontierMap(self.mapSize_pix) # cached frontier extraction for display modes 3-6
+      self.costmap = CostMap(self.frontiers.size, 1000.0*self.mapSize_m/self.frontiers.size) # clearance costs for display mode 7 and planning
+    self.featuresVersion = None # frontier labels version that features were last built from
+    self.goal = None # coordinates of where the planner is driving to, like destination [mm]
+    self.planner = None # incremental path planner over the reduced road map, kept between scans
+    self.failedPlans = 0 # plans in a row that found no way to the goal
+    self.waypointStep = 5 # how far along the planned path to put each waypoint [reduced pix]
+    self.waypointReached = 100 # distance at which a waypoint or the goal counts as reached [mm]
 
     self.robotSprite = np.array([[0,0,0,0,0,1,0,0,0,0,0], # shape of robot on map
                                  [0,0,0,0,0,1,0,0,0,0,0],
@@ -87,46 +115,32 @@ class DataMatrix(object):
     if self.displayMode == 0: return self.breezyMap if self.INTERNAL_MAP else self.pointMap
     if self.displayMode == 1: return self.breezyMap
     if self.displayMode == 2: return self.pointMap
-    fow_darkLimit = 80 # breezyMap value cutoff for points too low to be fog of war
-    fow_brightLimit = 200 # breezyMap value cutoff for points too high to be fog of war
-    wall_brightLimit = 240 # pointMap value cutoff for points too high to be walls
-    road_darkLimit = 240 # breezyMap value cutoff for points too low to be road
-    shrink_size = 200 # size of reduced-size map (used to speed up processing)
-    # stime = time.clock()
-    pointMapShrunk = shrinkTo(self.pointMap, shrink_size, shrink_size)
-    breezyMapShrunk = shrinkTo(self.breezyMap, shrink_size, shrink_size)
-    unexplored = np.logical_and(fow_darkLimit < breezyMapShrunk, breezyMapShrunk < fow_brightLimit)
-    wall = pointMapShrunk < wall_brightLimit
-    display = np.where(wall, 0, np.where(unexplored, 127, 255))
-    if self.displayMode == 3: return display # filtered
-
-    if self.displayMode == 6: return np.where(breezyMapShrunk > road_darkLimit, 255, 0) # roads
-
-    gradientx, gradienty = np.zeros((shrink_size,shrink_size), dtype=bool), np.zeros((shrink_size,shrink_size), dtype=bool)
-    n = 1 # number of times to take the diff (width of diff)
-    gradientx[:,:-n], gradienty[:-n,:] = np.absolute(np.diff(display, n=n, axis=1))==128, np.absolute(np.diff(display, n=n, axis=0))==128
-    targets = np.any([gradientx, np.roll(gradientx, n, axis=1), gradienty, np.roll(gradienty, n, axis=0)], axis=0)
-    # targets = np.logical_or(gradientx, gradienty)
-    if self.displayMode == 4: return np.where(targets, 127, np.where(wall, 0, 255)) # edges
-
-    lbl, num_lbls = label(targets, structure=[[1,1,1],[1,1,1],[1,1,1]])
-    self.addFeatures(lbl, num_lbls, shrink_size)
-    # etime = time.clock()
-    # print etime-stime
-    if self.displayMode == 5: return lbl*255/(lbl.max() if lbl.max() != 0 else 1) # targets
-
-  def addFeatures(self, lbl, num_lbls, shrink_size):
-    slices = find_objects(lbl) # index regions of each object in targets matrix
-    for i, coords in ((i, np.where(lbl == i+1)) for i in range(num_lbls)): # coordinates list for each feature
-      mass = len(coords[0]) # number of points in each object
-      if mass >= self.minTargSize: # only continue if object is of reasonable size
-        bounds = [slices[i][j].indices(shrink_size)[:2] for j in (0,1)] # slice.indices takes maximum index as argument
-        com = np.mean(coords, axis=1, dtype=int) # scipy's center_of_mass is too heavy (for literally no reason)
-        # self.features.append(Feature(mass, com, bounds, coords))
-
-  def getMapArray(self, size):
-    # return bytearray(imresize(self.breezyMap if self.INTERNAL_MAP else self.pointMap, size, interp='nearest'))
-    return bytearray(imresize(self.getMapMatrix(), size, interp='nearest'))
+    self.frontiers.update(self.pointMap, self.breezyMap) # only recomputes tiles changed since the last call
+    if self.displayMode == 3: return self.frontiers.getFiltered()
+    if self.displayMode == 6: return self.frontiers.getRoads()
+    if self.displayMode == 4: return self.frontiers.getEdges()
+    if self.displayMode == 7: return self.updateCostMap().getDisplay()
+    self.updateFeatures()
+    if self.displayMode == 5: return self.frontiers.getTargets()
+
+  def updateFeatures(self):
+    self.frontiers.update(self.pointMap, self.breezyMap)
+    if self.frontiers.version != self.featuresVersion: # frontier labels changed
+      self.addFeatures(self.frontiers.labels, self.frontiers.numLabels)
+      self.featuresVersion = self.frontiers.version
+    return self.features
+
+  def addFeatures(self, lbl, num_lbls):
+    self.features = FeatureTable(lbl, num_lbls, self.minTargSize) # only keeps objects of reasonable size
+
+  def getMapArray(self, size): # returns a reused uint8 buffer, overwritten by the next call
+    if size not in self.mapResizers: self.mapResizers[size] = NearestResizer(size)
+    return self.mapResizers[size].resize(self.getMapMatrix())
+
+  def getMapSnapshot(self): # copy of the map, and the robot's (x, y, heading) in its pixels, safe to hand to another thread
+    mapMatrix = np.array(self.getMapMatrix(), dtype=np.uint8)
+    scale = float(mapMatrix.shape[1])/self.mapSize_pix # smart maps can be smaller than the region map
+    return mapMatrix, (self.robot_pix[0]*scale, self.robot_pix[1]*scale, float(self.robot_pix[2]))
 
   def getInsetMatrix(self):
     return self.insetMatrix
@@ -141,12 +155,79 @@ class DataMatrix(object):
   def setRelDestination(self, relDestination):
     self.destination = wrt(relDestination, self.robot_rel, (0.0,0.0,0.0))
 
+  def setRelGoal(self, relGoal):
+    self.goal = wrt(relGoal, self.robot_rel, (0.0,0.0,0.0))
+    self.destination = None # next waypoint is picked by updatePlan
+    self.planner, self.failedPlans = None, 0
+
+  def getExploreSnapshot(self): # copies of what ExplorationThread needs to pick a frontier, safe to hand to another thread
+    costs = self.updateCostMap().costs
+    features = self.updateFeatures() # never changed once built, so needs no copy
+    return features, self.frontiers.roads.copy(), costs.copy(), self.frontiers.display == 127, self.rel2cell(self.robot_rel)
+
+  def setGoalCell(self, cell):
+    self.setRelGoal(wrt(self.cell2rel(cell), (0.0,0.0,0.0), self.robot_rel))
+
+  def clearGoal(self):
+    self.goal, self.destination, self.planner, self.failedPlans = None, None, None, 0
+
+  def rel2cell(self, point): # relative position [mm] to clipped (row, col) of reduced map
+    block = self.mapSize_pix//self.frontiers.size # map pixels per reduced pixel
+    col = int(self.mapCenter_pix + point[0]*self.mm2pix)//block
+    row = int(self.mapCenter_pix - point[1]*self.mm2pix)//block
+    return min(max(row, 0), self.frontiers.size-1), min(max(col, 0), self.frontiers.size-1)
+
+  def cell2rel(self, cell): # (row, col) of reduced map to relative position of its center [mm]
+    block = self.mapSize_pix//self.frontiers.size
+    return (((cell[1]+0.5)*block - self.mapCenter_pix)/self.mm2pix, (self.mapCenter_pix - (cell[0]+0.5)*block)/self.mm2pix, 0.0)
+
+  def hasReached(self, point): # is the robot within waypointReached of point?
+    dx, dy = vecDiff(point, self.robot_rel)[0:2]
+    return dx**2 + dy**2 < self.waypointReached**2
+
+  def updateCostMap(self):
+    self.frontiers.update(self.pointMap, self.breezyMap)
+    changedRows, changedCols = self.frontiers.takeWallChanges()
+    self.costmap.update(self.frontiers.wall, changedRows, changedCols) # only recomputes near walls that changed
+    return self.costmap
+
+  def updatePlan(self):
+    if not self.PLAN_PATHS or self.goal is None: return None
+    if self.hasReached(self.goal):
+      self.goal, self.planner = None, None
+      return None
+    costs = self.updateCostMap().costs
+    roadRows, roadCols = self.frontiers.takeRoadChanges() # dirty cells since the last plan
+    costRows, costCols = self.costmap.takeChanges()
+    start, end = self.rel2cell(self.robot_rel), self.rel2cell(self.goal)
+    if self.planner is None: # first plan to this goal is a full search
+      self.planner = DStarLite(self.frontiers.roads, start, end, costs)
+    else: # afterwards only repair what the robot's motion and the map changes affected
+      self.planner.moveTo(start)
+      self.planner.updateCells(np.concatenate((roadRows, costRows)), np.concatenate((roadCols, costCols)), self.frontiers.roads, costs)
+      self.planner.computePath()
+    path = self.planner.getPath()
+    if path is None: # no known way to the goal yet, so keep going to the last waypoint
+      self.failedPlans += 1
+      return None
+    self.failedPlans = 0
+
+    onPath = self.destination is not None and any((path == self.rel2cell(self.destination)).all(axis=1))
+    if onPath and not self.hasReached(self.destination):
+      return None # still on the way to a waypoint that is still on the path
+    if len(path) <= self.waypointStep + 1: self.destination = self.goal # last leg goes right to the goal
+    else: self.destination = self.cell2rel(path[self.waypointStep])
+    return self.getRelDestination()
+
   def get_robot_rel(self):
     return self.robot_rel
 
   def get_robot_abs(self):
     return self.robot_abs
 
+  def get_trajectory_abs(self): # later points are added past the end, so this stays the path so far (safe to hand to another thread)
+    return self.trajectory_abs.view()
+
   def getRobotPos(self, curr_pos, init=False):
     self.robot_abs = curr_pos
     if init: self.robot_init = self.robot_abs
@@ -154,62 +235,77 @@ class DataMatrix(object):
     xpix = float2int(curr_pos[0]*self.mm2pix) # robot wrt map center (mO) + mO wrt matrix origin (xO)  = robot wrt xO [pix]
     ypix = self.mapSize_pix-float2int(curr_pos[1]*self.mm2pix) # y is negative because pixels increase downwards (+y_mm = -y_pix = -np rows)
     self.robot_pix = (xpix, ypix, self.robot_rel[2])
-    self.trajectory.append(self.robot_pix)
+    self.trajectory.append(self.robot_pix[0:2])
+    self.trajectory_abs.append(self.robot_abs[0:2])
 
   def drawBreezyMap(self, breezyMap):
     if self.USE_BREEZY_MAP:
-      self.breezyMap = np.flipud(np.resize(np.array(breezyMap, dtype=np.uint8), (self.mapSize_pix,self.mapSize_pix)).T) # 7ms
+      breezyMap = np.flipud(np.resize(np.array(breezyMap, dtype=np.uint8), (self.mapSize_pix,self.mapSize_pix)).T) # 7ms
+      if self.SMARTNESS_ON: self.frontiers.markMask(breezyMap != self.breezyMap)
+      self.breezyMap = breezyMap
 
   def drawPointMap(self, points):
     if self.USE_POINT_MAP:
-      for (dist, ang) in (point for point in points if point[0] > 0): # only draw valid points
-        # pixel location of scan point # point wrt robot + robot wrt x0 = point wrt x0
-        x_pix = float2int( self.mapCenter_pix + ( self.robot_rel[0] + dist*np.sin(radians(ang+self.robot_rel[2])) )*self.mm2pix )
-        y_pix = float2int( self.mapCenter_pix - ( self.robot_rel[1] + dist*np.cos(radians(ang+self.robot_rel[2])) )*self.mm2pix )
-        try:
-          self.pointMap[y_pix, x_pix] -= self.mapIncr*(self.pointMap[y_pix, x_pix] > self.mapMin) # decrement value at location if above minimum value
-        except IndexError:
-          pass # scan out of bounds
+      points = np.asarray(points, dtype=float).reshape(-1,2)
+      dist, ang = points[:,0], np.radians(points[:,1]+self.robot_rel[2])
+      dist, ang = dist[dist > 0], ang[dist > 0] # only draw valid points
+
+      # pixel location of scan point # point wrt robot + robot wrt x0 = point wrt x0 # truncating +0.5 matches float2int
+      x_pix = (self.mapCenter_pix + ( self.robot_rel[0] + dist*np.sin(ang) )*self.mm2pix + 0.5).astype(np.intp)
+      y_pix = (self.mapCenter_pix - ( self.robot_rel[1] + dist*np.cos(ang) )*self.mm2pix + 0.5).astype(np.intp)
+      inMap = (0 <= x_pix) & (x_pix < self.mapSize_pix) & (0 <= y_pix) & (y_pix < self.mapSize_pix) # scan out of bounds
+
+      # decrement value at each location once per point there, without going below minimum value
+      pixels, hits = np.unique(y_pix[inMap]*self.mapSize_pix + x_pix[inMap], return_counts=True)
+      flatMap = self.pointMap.reshape(-1) # view, so writes go to pointMap
+      old = flatMap[pixels]
+      new = np.maximum(old.astype(int) - hits*self.mapIncr, self.mapMin)
+      flatMap[pixels] = new
+      if self.SMARTNESS_ON: # pixels already at the minimum don't change any frontiers
+        changed = pixels[new != old]
+        self.frontiers.markPixels(changed // self.mapSize_pix, changed % self.mapSize_pix)
 
   def drawInset(self):
     source = self.breezyMap if self.INTERNAL_MAP else self.pointMap
     x, y = self.robot_pix[0:2] # indices of center of robot in main map
-    raw = int(self.insetSize_pix*0.75) # half the size of the main map segment to capture
-    rad = self.insetSize_pix/2 # half the size of the final segment
-
-    mapChunk = source[y-raw:y+raw, x-raw:x+raw]
-    s = slice(raw-rad, raw+rad, 1) # region of rotated chunk that we want
-    self.insetMatrix = rotate(mapChunk, self.robot_pix[2], output=np.uint8, order=1, reshape=False)[s,s]
+    self.insetSampler.sample(source, y-0.5, x-0.5, self.robot_pix[2]) # same pixels as rotating a chunk centered there # 2ms
 
   def drawRobot(self, mapObject, pos, val):
+    from scipy.ndimage.interpolation import rotate # only loaded once the robot is first drawn (for saving)
     robotMat = rotate(self.robotSprite, -pos[2])
-    hgt = (robotMat.shape[0]-1)/2 # indices of center of robot
-    wid = (robotMat.shape[1]-1)/2
-    x = slice(pos[0]-wid, pos[0]+wid+1, 1) # columns
-    y = slice(pos[1]-hgt, pos[1]+hgt+1, 1) # rows
+    hgt = (robotMat.shape[0]-1)//2 # indices of center of robot
+    wid = (robotMat.shape[1]-1)//2
+    x = slice(pos[0]-wid, pos[0]-wid+robotMat.shape[1], 1) # columns # rotated sprites can have even sizes
+    y = slice(pos[1]-hgt, pos[1]-hgt+robotMat.shape[0], 1) # rows
     mapObject[y,x][robotMat.astype(bool)] = val
 
   def drawPath(self, mapObject, inSlice, val):
-    for x, y, theta in self.trajectory[inSlice]:
-      mapObject[y,x] = val
-
-  def saveImage(self):
-    from PIL import Image # don't have PIL? sorry (try pypng)
-    import os
-    filename = time.strftime('%Y-%m-%dT%Hh%Mm%Ss', time.localtime()) + "_" + str(int(self.mapSize_m)) + "meters.png"
-
-    robot = np.zeros((self.mapSize_pix, self.mapSize_pix), dtype=bool) # initialize robot matrix
+    points = self.trajectory[inSlice]
+    mapObject[points[:,1], points[:,0]] = val
+
+  def getPathLayer(self):
+    end = len(self.trajectory) - 1 # all points except the current one, which the robot is drawn over
+    if end > self.pathDrawn:
+      self.drawPath(self.pathLayer, slice(self.pathDrawn, end), True)
+      self.pathDrawn = end
+    return self.pathLayer
+
+  def getSnapshot(self): # copies of everything saved, taken at once so the files can be written on another thread
+    robot = self.getPathLayer().copy() # initialize robot matrix with the path so far
     self.drawRobot(robot, self.robot_pix, 1)
-    self.drawPath(robot, slice(None,-1,None), 1) # draw all values except last one # same as ":-1"
-
-    GB = np.where(robot, 0, self.breezyMap if self.INTERNAL_MAP else self.pointMap).astype(np.uint8) # copy map, assign to color layers
-    R = np.where(robot, 255, GB).astype(np.uint8) # add robot path to red layer
+    return {'map': (self.breezyMap if self.INTERNAL_MAP else self.pointMap).copy(), 'robot': robot,
+            'trajectory': self.trajectory.view().copy(), 'pose': np.array(self.robot_rel), 'resolution': 1000*self.mm2pix,
+            'mapSize_m': self.mapSize_m, 'time': time.localtime()}
 
-    im = Image.fromarray(np.dstack((R,GB,GB))) # create image from depth stack of three layers
-    # filepath = os.path.join('examples',filename)
-    filepath = os.path.join(filename)
-    im.save(filepath) # save image
+  def saveImage(self, view=True, format='png'): # view opens the image once it's saved
+    filepath = writeSnapshot(self.getSnapshot(), format)
     print("Image saved to " + filepath)
-
-    import subprocess # used to display the image (not necessary for save)
-    subprocess.call(["eog", filepath]) # open with eye of gnome
\ No newline at end of file
+    if view and format == 'png': viewImage(filepath)
+    return filepath
+
+  def exportTiles(self, directory='tiles', mapMatrix=None): # returns the number of tiles written
+    # pass a snapshot's map to export it on another thread (one export at a time)
+    if self.tilePyramid is None or self.tilePyramid.directory != directory:
+      from mapserver import TilePyramid # pulls in the HTTP server modules, so only loaded if tiles are exported
+      self.tilePyramid = TilePyramid(directory, blank=127 if self.INTERNAL_MAP else 255) # unmapped value of each map
+    return self.tilePyramid.export((self.breezyMap if self.INTERNAL_MAP else self.pointMap) if mapMatrix is None else mapMatrix)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# exploration.py - picks the next frontier for the robot to explore, in a background thread
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from tools import PYTHON_SERIES, MOVES, INSCRIBED_COST
+if PYTHON_SERIES == 2: from Queue import Queue, Empty as QueueEmpty
+elif PYTHON_SERIES == 3: from queue import Queue, Empty as QueueEmpty
+from threading import Thread, Event
+import numpy as np
+
+GAIN_RADIUS = 10 # half-width of the square around a frontier whose unexplored pixels count as its information gain [pix]
+VISITED_RADIUS = 3 # frontier points this close to a goal already given are not picked again [pix]
+MAX_FAILED_PLANS = 10 # map updates in a row with no path to a goal before exploring gives up on it
+
+
+def pathCosts(roads, costs, start): # cost of the cheapest path from start to every pixel, like DStarLite plans
+  from scipy.sparse import csr_matrix # scipy loads when exploring starts, not at startup
+  from scipy.sparse.csgraph import dijkstra
+  size = roads.shape[0]*roads.shape[1]
+  passable = (roads & (costs < INSCRIBED_COST)).ravel()
+  nodes = np.arange(size).reshape(roads.shape)
+  startNode = start[0]*roads.shape[1] + start[1]
+  heads, tails, weights = [], [], []
+  for dr, dc in MOVES: # one edge into every passable pixel from each neighbor
+    head = nodes[max(-dr,0):roads.shape[0]-max(dr,0), max(-dc,0):roads.shape[1]-max(dc,0)].ravel()
+    tail = head + dr*roads.shape[1] + dc
+    keep = passable[tail] & (passable[head] | (head == startNode)) # the start may be off the roads
+    heads.append(head[keep])
+    tails.append(tail[keep])
+    weights.append((141 if dr and dc else 100) + costs.ravel()[tail[keep]].astype(int))
+  graph = csr_matrix((np.concatenate(weights), (np.concatenate(heads), np.concatenate(tails))), shape=(size, size))
+  return dijkstra(graph, indices=startNode).reshape(roads.shape)
+
+def pickFrontier(features, roads, costs, unexplored, start, visited=()):
+  # returns the (row, col) of the best frontier to drive to, ranked by information gain over path cost, or None
+  if len(features) == 0: return None
+  reached = pathCosts(roads, costs, start)
+  padded = np.pad(reached, 1, 'constant', constant_values=np.inf)
+  shape = reached.shape
+  neighbors = np.min([(141 if dr and dc else 100) + padded[1+dr:1+dr+shape[0], 1+dc:1+dc+shape[1]] for dr, dc in MOVES], axis=0)
+  arrive = np.minimum(reached, neighbors + costs) # DStarLite can always enter its end, so frontiers may be off the roads
+  for row, col in visited: # don't go back to goals that didn't clear their frontier
+    arrive[max(row-VISITED_RADIUS,0):row+VISITED_RADIUS+1, max(col-VISITED_RADIUS,0):col+VISITED_RADIUS+1] = np.inf
+
+  pointCosts = arrive[features.rows, features.cols]
+  starts = features.table['start']
+  cost = np.minimum.reduceat(pointCosts, starts) # cheapest point of each feature
+  best = np.zeros(len(features), dtype=int) # index of that point within each feature
+  for i in np.nonzero(np.isfinite(cost))[0]: # few features, so a loop is fine
+    best[i] = np.argmin(pointCosts[starts[i]:features.table['stop'][i]])
+
+  integral = np.zeros((shape[0]+1, shape[1]+1), dtype=int) # summed-area table of unexplored pixels
+  integral[1:,1:] = unexplored.cumsum(axis=0).cumsum(axis=1)
+  r0, r1 = np.clip(features.table['row'] - GAIN_RADIUS, 0, shape[0]), np.clip(features.table['row'] + GAIN_RADIUS + 1, 0, shape[0])
+  c0, c1 = np.clip(features.table['col'] - GAIN_RADIUS, 0, shape[1]), np.clip(features.table['col'] + GAIN_RADIUS + 1, 0, shape[1])
+  gain = features.table['mass'] + integral[r1,c1] - integral[r0,c1] - integral[r1,c0] + integral[r0,c0]
+
+  score = np.where(np.isfinite(cost), gain/np.maximum(cost, 100.0), -1)
+  choice = np.argmax(score)
+  if score[choice] < 0: return None # no frontier can be reached
+  point = starts[choice] + best[choice]
+  return features.rows[point], features.cols[point]
+
+def frontierCleared(features, goal): # has the frontier a goal was picked from been explored since? (goal is (row, col))
+  return features.nearest(*goal)[1] > VISITED_RADIUS # the frontier moves as the map fills in, so look around the goal
+
+
+class ExplorationThread(Thread):
+  # init     creates the request and result queues for the worker
+  # stop     ends the worker loop
+  # request  hands the worker a map snapshot to pick a goal from, unless it is still working on the last one
+  # getGoal  returns the (row, col) goal picked from the last snapshot if it is ready, or None
+  # run      picks goals from snapshots until stopped, calling notify (on this thread) once each goal is ready
+
+  def __init__(self, notify=None):
+    super(ExplorationThread, self).__init__()
+    self.daemon = True # don't keep the program alive
+    self.requests, self.results = Queue(), Queue()
+    self.notify = notify if notify is not None else lambda: None
+    self.pending = False # has a request been made whose result hasn't been taken yet? (only touched by caller)
+    self._stop = Event()
+
+  def stop(self):
+    self._stop.set()
+    self.requests.put(None) # wake the worker
+
+  def request(self, features, roads, costs, unexplored, start, visited=()): # arrays must not be changed afterwards
+    if self.pending: return False
+    self.pending = True
+    self.requests.put((features, roads, costs, unexplored, start, list(visited)))
+    return True
+
+  def getGoal(self):
+    try: goal = self.results.get_nowait()
+    except QueueEmpty: return None
+    self.pending = False
+    return goal
+
+  def run(self):
+    while not self._stop.isSet():
+      snapshot = self.requests.get() # blocks, rather than polling, until there's a snapshot
+      if snapshot is None: continue # woken to stop
+      self.results.put(pickFrontier(*snapshot))
+      self.notify()
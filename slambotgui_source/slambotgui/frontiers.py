@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+# frontiers.py - cached, tile-incremental frontier extraction from the SLAM maps
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+FOW_DARK_LIMIT = 80 # breezyMap value cutoff for points too low to be fog of war
+FOW_BRIGHT_LIMIT = 200 # breezyMap value cutoff for points too high to be fog of war
+WALL_BRIGHT_LIMIT = 240 # pointMap value cutoff for points too high to be walls
+ROAD_DARK_LIMIT = 240 # breezyMap value cutoff for points too low to be road
+SHRINK_SIZE = 200 # size of reduced-size map (used to speed up processing)
+TILE_SIZE = 10 # width of each change-tracking tile [reduced-size pix]
+CONNECTIVITY = np.ones((3,3), dtype=int) # diagonal neighbors belong to the same frontier
+FEATURE_DTYPE = np.dtype([('label', np.int32), # label of the feature in the labeled map
+                          ('mass', np.int32), # size of feature [square pix]
+                          ('row', np.int32), ('col', np.int32), # center of feature [pix]
+                          ('rowMin', np.int32), ('rowMax', np.int32), # row bounds, as slice start and stop [pix]
+                          ('colMin', np.int32), ('colMax', np.int32), # column bounds [pix]
+                          ('start', np.int32), ('stop', np.int32)]) # extent of feature's points in FeatureTable.rows/cols
+
+
+def blockSums(tiles, block): # sum each block x block square of a stack of square tiles
+  num, size = tiles.shape[0], tiles.shape[1]//block
+  rowSums = tiles.reshape(num, size, block, size*block).sum(axis=2, dtype=np.int64) # summing one axis at a time is ~3x faster
+  return rowSums.reshape(num, size, size, block).sum(axis=3)
+
+
+class FeatureTable(object):
+  # init       gathers the statistics of every labeled feature in one pass over the labeled map
+  # len        returns the number of features kept
+  # getCoords  returns the ([rows], [cols]) locations of all points of the feature at the given index
+  # featureAt  returns the index of the feature covering each given pixel, or -1
+  # findPairs  returns every (this, that) pair of feature indices that overlap or come within reach pixels
+  # nearest    returns the index of the feature with a point closest to the given pixel, and that distance
+
+  def __init__(self, labels, numLabels, minMass=1):
+    self.shape = labels.shape
+    points = np.flatnonzero(labels) # flat index of every labeled pixel, in raster order
+    owners = labels.ravel()[points]
+    order = np.argsort(owners, kind='mergesort') # group points by label, keeping raster order within each
+    points, owners = points[order], owners[order]
+    rows, cols = points // self.shape[1], points % self.shape[1]
+
+    mass = np.bincount(owners, minlength=numLabels+1)[1:]
+    starts = np.cumsum(mass) - mass
+    found = mass > 0 # guards reduceat against labels with no points
+    table = np.zeros(numLabels, dtype=FEATURE_DTYPE)
+    table['label'], table['mass'] = np.arange(1, numLabels+1), mass
+    if found.any():
+      table['row'][found] = np.bincount(owners, weights=rows)[1:][found] // mass[found] # truncated mean, like np.mean(dtype=int)
+      table['col'][found] = np.bincount(owners, weights=cols)[1:][found] // mass[found]
+      table['rowMin'][found] = np.minimum.reduceat(rows, starts[found])
+      table['rowMax'][found] = np.maximum.reduceat(rows, starts[found]) + 1
+      table['colMin'][found] = np.minimum.reduceat(cols, starts[found])
+      table['colMax'][found] = np.maximum.reduceat(cols, starts[found]) + 1
+
+    keep = mass >= max(minMass, 1) # only keep features of reasonable size
+    keepPoints = np.repeat(keep, mass)
+    self.table = table[keep]
+    self.table['stop'] = np.cumsum(self.table['mass'])
+    self.table['start'] = self.table['stop'] - self.table['mass']
+    self.rows, self.cols = rows[keepPoints], cols[keepPoints]
+    self.owners = np.repeat(np.arange(len(self.table), dtype=np.int32), self.table['mass']) # feature index of each point
+    self.grid = -np.ones(self.shape, dtype=np.int32) # grid hash from pixel to feature index
+    self.grid[self.rows, self.cols] = self.owners
+    self.tree = None # KD-tree of all points, built on first nearest() query
+
+  def __len__(self):
+    return len(self.table)
+
+  def getCoords(self, i):
+    span = slice(self.table['start'][i], self.table['stop'][i])
+    return self.rows[span], self.cols[span]
+
+  def featureAt(self, rows, cols):
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    inMap = (0 <= rows) & (rows < self.shape[0]) & (0 <= cols) & (cols < self.shape[1])
+    return np.where(inMap, self.grid[np.where(inMap, rows, 0), np.where(inMap, cols, 0)], -1)
+
+  def findPairs(self, that, reach=0): # reach=0 finds overlaps, reach=1 also finds touching features
+    offsets = np.arange(-reach, reach+1)
+    rowSteps, colSteps = np.repeat(offsets, len(offsets)), np.tile(offsets, len(offsets))
+    others = that.featureAt(self.rows[:,np.newaxis] + rowSteps, self.cols[:,np.newaxis] + colSteps) # every point's neighborhood at once
+    hit = others >= 0
+    codes = np.unique(np.repeat(self.owners, len(rowSteps))[hit.ravel()].astype(np.int64)*len(that) + others[hit]) # de-duplicate pairs
+    return np.column_stack((codes // max(len(that), 1), codes % max(len(that), 1)))
+
+  def nearest(self, row, col):
+    if len(self) == 0: return -1, np.inf
+    if self.tree is None:
+      from scipy.spatial import cKDTree
+      self.tree = cKDTree(np.column_stack((self.rows, self.cols)))
+    dist, point = self.tree.query((row, col))
+    return self.owners[point], dist
+
+
+def mergeFeatures(tables, minMass=1, reach=1): # merges every overlapping or touching feature of several tables into one table
+  starts = np.cumsum([0] + [len(table) for table in tables]) # features of all tables, numbered one table after another
+  if starts[-1] == 0: return FeatureTable(np.zeros(tables[0].shape, dtype=np.int32), 0, minMass)
+  pairs = [np.zeros((0,2), dtype=np.int64)]
+  for i, this in enumerate(tables): # a table's own pairs count too, since reach may join features it labeled apart
+    for j in range(i, len(tables)):
+      pairs.append(this.findPairs(tables[j], reach) + (starts[i], starts[j]))
+  pairs = np.concatenate(pairs)
+  from scipy.sparse import coo_matrix # scipy loads when frontiers are first merged, not at startup
+  from scipy.sparse.csgraph import connected_components
+  graph = coo_matrix((np.ones(len(pairs), dtype=bool), (pairs[:,0], pairs[:,1])), shape=(starts[-1], starts[-1]))
+  numMerged, merged = connected_components(graph, directed=False) # each group of linked features becomes one
+  labels = np.zeros(tables[0].shape, dtype=np.int32)
+  for start, table in zip(starts, tables):
+    labels[table.rows, table.cols] = merged[start + table.owners] + 1
+  return FeatureTable(labels, numMerged, minMass)
+
+
+class FrontierMap(object):
+  # init             allocates the cached reduced-size maps for a square map of mapSize pixels
+  # markPixels       flags the tiles holding the given full-size map pixels as changed
+  # markMask         flags the tiles holding any True pixel of a full-size change mask
+  # update           refreshes the reduced maps, classes and frontier labels of flagged tiles only
+  # takeRoadChanges  returns the (rows, cols) of road pixels that changed since the last call, for planners
+  # takeWallChanges  returns the (rows, cols) of wall pixels that changed since the last call, for cost maps
+  # getFiltered      returns the wall/unexplored/open map (display mode 3)
+  # getEdges         returns frontier pixels drawn over the walls (display mode 4)
+  # getTargets       returns the labeled frontiers scaled for display (display mode 5)
+  # getRoads         returns the driveable map (display mode 6)
+
+  def __init__(self, mapSize, shrinkSize=SHRINK_SIZE, tileSize=TILE_SIZE): # tileSize must divide shrinkSize
+    self.size = shrinkSize
+    self.block = mapSize//shrinkSize # full-size pixels per reduced pixel
+    self.span = self.block*shrinkSize # full-size pixels covered (any remainder at the far edges is ignored)
+    self.tileSize = tileSize
+    self.tilePix = self.block*tileSize # full-size pixels per tile
+    self.numTiles = shrinkSize//tileSize # tiles across the map
+    self.dirty = np.ones((self.numTiles, self.numTiles), dtype=bool) # everything needs computing the first time
+
+    self.pointSums = np.zeros((shrinkSize, shrinkSize), dtype=np.int64) # un-normalized reduced maps
+    self.breezySums = np.zeros((shrinkSize, shrinkSize), dtype=np.int64)
+    self.pointMax, self.breezyMax = None, None # normalization of the reduced maps
+    self.roads = np.zeros((shrinkSize, shrinkSize), dtype=bool) # driveable pixels
+    self.roadsChanged = np.zeros((shrinkSize, shrinkSize), dtype=bool) # road pixels flipped since last taken
+    self.wall = np.zeros((shrinkSize, shrinkSize), dtype=bool)
+    self.wallsChanged = np.zeros((shrinkSize, shrinkSize), dtype=bool) # wall pixels flipped since last taken
+    self.display = np.zeros((shrinkSize, shrinkSize), dtype=np.uint8)
+    self.targets = np.zeros((shrinkSize, shrinkSize), dtype=bool) # frontier pixels, between unexplored and open space
+    self.labels = np.zeros((shrinkSize, shrinkSize), dtype=np.int32) # connected frontier sets, numbered from 1
+    self.numLabels = 0
+    self.version = 0 # incremented every time the labels change
+
+  def markPixels(self, rows, cols):
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    inSpan = (rows < self.span) & (cols < self.span)
+    self.dirty[rows[inSpan]//self.tilePix, cols[inSpan]//self.tilePix] = True
+
+  def markMask(self, mask):
+    n, t = self.numTiles, self.tilePix
+    self.dirty |= mask[:self.span, :self.span].reshape(n, t, n, t).any(axis=(1,3))
+
+  def update(self, pointMap, breezyMap):
+    if not self.dirty.any(): return False # nothing has changed since the last update
+    n, t, ts = self.numTiles, self.tilePix, self.tileSize
+    tileRows, tileCols = np.nonzero(self.dirty)
+    for sums, source in ((self.pointSums, pointMap), (self.breezySums, breezyMap)): # gather flagged tiles, reduce, scatter back
+      tiles = source[:self.span, :self.span].reshape(n, t, n, t)[tileRows, :, tileCols, :]
+      sums.reshape(n, ts, n, ts)[tileRows, :, tileCols, :] = blockSums(tiles, self.block)
+    self.dirty[:] = False
+    r0, r1 = tileRows.min()*ts, (tileRows.max()+1)*ts # reduced-size bounds of the flagged tiles
+    c0, c1 = tileCols.min()*ts, (tileCols.max()+1)*ts
+
+    pointMax, breezyMax = max(self.pointSums.max(), 1), max(self.breezySums.max(), 1)
+    if (pointMax, breezyMax) != (self.pointMax, self.breezyMax): # rescaled, so every reduced pixel may change class
+      self.pointMax, self.breezyMax = pointMax, breezyMax
+      r0, r1, c0, c1 = 0, self.size, 0, self.size
+    self.classify(r0, r1, c0, c1)
+    return True
+
+  def classify(self, r0, r1, c0, c1):
+    pointShrunk = self.pointSums[r0:r1, c0:c1]*255//self.pointMax
+    breezyShrunk = self.breezySums[r0:r1, c0:c1]*255//self.breezyMax
+    unexplored = (FOW_DARK_LIMIT < breezyShrunk) & (breezyShrunk < FOW_BRIGHT_LIMIT)
+    wall = pointShrunk < WALL_BRIGHT_LIMIT
+    roads = breezyShrunk > ROAD_DARK_LIMIT
+    self.roadsChanged[r0:r1, c0:c1] |= roads != self.roads[r0:r1, c0:c1]
+    self.roads[r0:r1, c0:c1] = roads
+    self.wallsChanged[r0:r1, c0:c1] |= wall != self.wall[r0:r1, c0:c1]
+    self.wall[r0:r1, c0:c1] = wall
+    self.display[r0:r1, c0:c1] = np.where(wall, 0, np.where(unexplored, 127, 255))
+
+    # a frontier pixel touches an unexplored/open boundary, so targets change up to one pixel outside the region
+    r0, r1, c0, c1 = max(r0-1, 0), min(r1+1, self.size), max(c0-1, 0), min(c1+1, self.size)
+    R0, R1, C0, C1 = max(r0-1, 0), min(r1+1, self.size), max(c0-1, 0), min(c1+1, self.size)
+    display = self.display[R0:R1, C0:C1].astype(np.int16)
+    edgex, edgey = np.absolute(np.diff(display, axis=1))==128, np.absolute(np.diff(display, axis=0))==128
+    targets = np.zeros(display.shape, dtype=bool) # mark both pixels on either side of each boundary
+    targets[:,:-1] |= edgex
+    targets[:,1:] |= edgex
+    targets[:-1,:] |= edgey
+    targets[1:,:] |= edgey
+    targets = targets[r0-R0:r1-R0, c0-C0:c1-C0]
+
+    if not np.array_equal(targets, self.targets[r0:r1, c0:c1]): # relabeling the reduced map whole is sub-millisecond
+      self.targets[r0:r1, c0:c1] = targets
+      from scipy.ndimage.measurements import label
+      self.labels, self.numLabels = label(self.targets, structure=CONNECTIVITY, output=np.int32)
+      self.version += 1
+
+  def takeRoadChanges(self):
+    changes = np.nonzero(self.roadsChanged)
+    self.roadsChanged[:] = False
+    return changes
+
+  def takeWallChanges(self):
+    changes = np.nonzero(self.wallsChanged)
+    self.wallsChanged[:] = False
+    return changes
+
+  def getFiltered(self):
+    return self.display
+
+  def getEdges(self):
+    return np.where(self.targets, 127, np.where(self.wall, 0, 255))
+
+  def getTargets(self):
+    return self.labels*255//max(self.numLabels, 1)
+
+  def getRoads(self):
+    return np.where(self.roads, 255, 0)
@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from tools import drawMarker, removeMarkers, PYTHON_SERIES
+from tools import drawMarker, moveMarker, PYTHON_SERIES, PostQueue, CAN_SELECT_PIPES, POST_POLL_RATE
 if PYTHON_SERIES == 2: import Tkinter as tk
 elif PYTHON_SERIES == 3: import tkinter as tk
 import matplotlib.pyplot as plt
@@ -30,16 +30,54 @@ DPI = 131.2 # calculated from $ xrandr
 CMAP = plt.get_cmap('gray') # opposite of "binary"
 
 
+class TkPoster(object):
+  # runs functions posted from other threads on the Tk thread, which is the only one allowed to touch Tk
+  # init  has Tk wake up and run posted functions as soon as any are posted
+  # post  (any thread) queues func to run on the Tk thread
+  # poll  where Tk can't wait on the post pipe (Windows), checks for posted functions every POST_POLL_RATE ms instead
+
+  def __init__(self, master):
+    self.master = master
+    self.posted = PostQueue()
+    self.post = self.posted.post
+    if CAN_SELECT_PIPES: master.tk.createfilehandler(self.posted, tk.READABLE, lambda *event: self.posted.runPosted())
+    else: self.poll()
+
+  def poll(self):
+    self.posted.runPosted()
+    self.master.after(POST_POLL_RATE, self.poll)
+
+
+class BlitAxes(object):
+  # redraws only the changing artists of one axes over a saved copy of the rest of the figure, instead of the whole figure
+  # init    marks the artists as animated, so full draws leave them out of the saved background
+  # onDraw  saves the background after every full draw (first show, resizing, zooming) and draws the artists over it
+  # update  restores the background, draws the artists, and blits just the axes to the screen
+
+  def __init__(self, canvas, ax, artists):
+    self.canvas, self.ax, self.artists = canvas, ax, artists
+    for artist in artists: artist.set_animated(True)
+    self.background = None # until the first full draw
+    canvas.mpl_connect('draw_event', self.onDraw)
+
+  def onDraw(self, event):
+    self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+    for artist in self.artists: self.ax.draw_artist(artist)
+
+  def update(self):
+    if self.background is None: return self.canvas.draw() # captures the background
+    self.canvas.restore_region(self.background)
+    for artist in self.artists: self.ax.draw_artist(artist)
+    self.canvas.blit(self.ax.bbox)
+
+
 class RegionFrame(tk.Frame): # tkinter frame, inheriting from the tkinter Frame class
   # displays the region map with robot at current position, which is scrollable and zoomable, using matplotlib
   # init            draws all fields in the output frame of the main App
-  # updateMaps      draws all map data onto the matplotlib figures
-  # removeMarkers   deletes all temporary markers on the main map (old robot position)
-  # drawMarker      draws robot on main map using matplotlib marker
+  # updateMap       moves the robot marker and redraws the map image, blitting only the map axes
 
   def __init__(self, master, mapMatrix, MAP_SIZE_M=8, **unused):
     tk.Frame.__init__(self, master) # explicitly initialize base class and create window
-    self.markers = [] # current matplotlib markers
 
     # current (and only) figure
     self.fig = plt.figure(figsize=(5, 5), dpi=DPI, facecolor=self.master.cget('bg')) # create matplotlib figure
@@ -65,17 +103,13 @@ class RegionFrame(tk.Frame): # tkinter frame, inheriting from the tkinter Frame
     self.canvas._tkcanvas.pack(fill='both', expand=True)
     NavigationToolbar2TkAgg(self.canvas, self)
 
-  def updateMap(self, robotRel, destination, mapMatrix):
-    # send maps to image object
-    self.myImg.set_data(mapMatrix) # 20ms
-
-    # finishing touches
-    removeMarkers(self.markers) # delete old robot position from map
-    marker = drawMarker(self.ax, robotRel, destination) # add new robot position to map # 0.2ms
-    self.markers.append(marker) # marker is a list of matplotlib.line.Line2D objects
+    self.marker = drawMarker(self.ax, (0,0,0)) # robot position, moved every update
+    self.blitter = BlitAxes(self.canvas, self.ax, [self.myImg, self.marker])
 
-    # refresh the figure
-    self.canvas.draw() # 200ms
+  def updateMap(self, robotRel, destination, mapMatrix):
+    self.myImg.set_data(mapMatrix) # send maps to image object
+    moveMarker(self.marker, robotRel, destination)
+    self.blitter.update() # redraw just the map axes # 27ms
 
 
 ######################################################################################
@@ -98,7 +132,8 @@ class DisplayModeFrame(tk.Frame): # tkinter frame, inheriting from the tkinter F
                     'Filtered': 3,
                     'Edges': 4,
                     'Targets': 5,
-                    'Roads': 6}
+                    'Roads': 6,
+                    'Costs': 7}
     options = sorted(displayModes.iterkeys(), key=lambda k: displayModes[k]) # get keys, in value order
     tk.OptionMenu(self, displayMode, *options).pack(side='left')
     displayMode.trace('w', lambda *args: self.setDisplayMode(displayModes[displayMode.get()]))
@@ -112,15 +147,13 @@ from math import atan2, degrees
 class InsetFrame(tk.Frame): # tkinter frame, inheriting from the tkinter Frame class
   # displays robot's environs oriented to the robot, supporting clicking on the map to send a drive command
   # init            draws all fields in the output frame of the main App
-  # updateMaps      draws all map data onto the matplotlib figures
-  # removeMarkers   deletes all temporary markers on the main map (old robot position)
-  # drawMarker      draws robot on main map using matplotlib marker
+  # updateMap       moves the destination line and redraws the inset image, blitting only the inset axes
 
-  def __init__(self, master, insetMatrix, sendCommand=None, setRelDestination=None, INSET_SIZE_M=2, **unused):
+  def __init__(self, master, insetMatrix, sendCommand=None, setRelDestination=None, setRelGoal=None, INSET_SIZE_M=2, **unused):
     tk.Frame.__init__(self, master) # explicitly initialize base class and create window
     self.sendCommand = sendCommand
     self.setRelDestination = setRelDestination
-    self.markers = [] # current matplotlib markers
+    self.setRelGoal = setRelGoal # if given, clicks set a goal for the path planner instead of driving straight there
 
     # current (and only) figure
     self.fig = plt.figure(figsize=(3, 4.5), dpi=DPI, facecolor=self.master.cget('bg')) # create matplotlib figure
@@ -128,7 +161,6 @@ class InsetFrame(tk.Frame): # tkinter frame, inheriting from the tkinter Frame c
     # subplot 2 (relative map)
     self.ax = plt.subplot(111) # add plot 2 to figure
     self.ax.set_title("Robot Environs") # name and label plot
-    self.ax.set_xlabel("", family='monospace')
     self.myImg = self.ax.imshow(insetMatrix, interpolation='none', cmap=CMAP, vmin=0, vmax=255, # plot data
               extent=[-INSET_SIZE_M/2, INSET_SIZE_M/2, -INSET_SIZE_M/2, INSET_SIZE_M/2])
     self.ax.tick_params(axis='both', which='major', labelsize=12)
@@ -138,11 +170,19 @@ class InsetFrame(tk.Frame): # tkinter frame, inheriting from the tkinter Frame c
     self.canvas._tkcanvas.config(highlightthickness=0)
     self.canvas._tkcanvas.pack(fill='both', expand=True)
 
+    self.marker = drawMarker(self.ax, (0,0,0)) # permanent robot at center of inset map, with line to destination
+    self.blitter = BlitAxes(self.canvas, self.ax, [self.myImg, self.marker])
+
     # make notification string to display mouse position
     self.notifyStr = tk.StringVar()
     self.notifyStr.set("\n") # pre-fill to final size
     tk.Label(self, textvariable=self.notifyStr).pack(side='bottom', fill='both')
 
+    # robot position, in a label instead of the axes so it doesn't need the whole figure redrawn
+    self.positionStr = tk.StringVar()
+    self.positionStr.set("\n")
+    tk.Label(self, textvariable=self.positionStr, font=('Courier', 10)).pack(side='bottom', fill='both')
+
     if sendCommand: # should we be able to send a command to the robot? (are we controlling the robot)
       self.fig.canvas.mpl_connect('button_press_event', self.onClick)
       self.fig.canvas.mpl_connect('motion_notify_event', self.onMovement)
@@ -152,25 +192,21 @@ class InsetFrame(tk.Frame): # tkinter frame, inheriting from the tkinter Frame c
       x, y = 1000*event.xdata, 1000*event.ydata # convert to mm for internal use
       ang = degrees(atan2(x,y))
       dist = (x**2 + y**2)**0.5
-      self.setRelDestination((x, y, 0.0))
-      self.sendCommand('c{0:0.1f}c{1:0.0f}'.format(ang,dist))
+      if self.setRelGoal: # planner finds the way and sends the commands
+        self.setRelGoal((x, y, 0.0))
+      else:
+        self.setRelDestination((x, y, 0.0))
+        self.sendCommand('c{0:0.1f}c{1:0.0f}'.format(ang,dist))
 
   def onMovement(self, event):
     if event.inaxes == self.ax: # mouse is over inset map
       self.notifyStr.set('Mouse at: {0:0.0f}mm, {1:0.0f}mm\nClick to send robot here.'.format(1000*event.xdata,1000*event.ydata))
 
   def updateMap(self, robotRel, destination, insetMatrix):
-    # send maps to image object
-    self.myImg.set_data(insetMatrix) # 0.4ms
-
-    # finishing touches
-    removeMarkers(self.markers) # delete old robot position from map
-    marker = drawMarker(self.ax, (0,0,0), destination) # draw permanent robot at center of inset map
-    self.markers.append(marker) # marker is a list of matplotlib.line.Line2D objects
-    self.ax.set_xlabel('X = {0:6.1f}; Y = {1:6.1f};\nHeading = {2:6.1f}'.format(*robotRel))
-
-    # refresh the figure
-    self.canvas.draw() # 200ms
+    self.myImg.set_data(insetMatrix) # send maps to image object # 0.4ms
+    moveMarker(self.marker, (0,0,0), destination)
+    self.positionStr.set('X = {0:6.1f}; Y = {1:6.1f};\nHeading = {2:6.1f}'.format(*robotRel))
+    self.blitter.update() # redraw just the inset axes # 4ms
 
 
 ######################################################################################
@@ -185,15 +221,22 @@ MAX_TX_TRIES = 3 # max number of times to try to resend command before giving up
 class EntryFrame(tk.Frame):
   # displays the status of the robot and contains methods to send data to the robot while running base station code to control robot
   # sendCommand     send string to command entry box, identical to typing command and hitting Send/<Return>
-  # manualSend      triggered by request to manually send the command in the text box
-  # autoSendCommand loop to control sending of commands, including automatic retries and continuous drive commands
+  #                   (or, while a command is waiting for an ACK, once that one is done, keeping only the newest)
+  # manualSend      sends the command in the text box, and keeps resending value-setting commands until they're ACKed
+  # autosendCommand keeps sending continuous drive commands (capitalized normal commands) while they're in the text box
+  # resendCommand   resends the command waiting for an ACK, every CMD_RATE, until MAX_TX_TRIES
+  # ackReceived     call when the serial thread gets an ACK, to stop resending
 
   def __init__(self, master, robot, closeWin, restartAll, saveImage, getACK, resetACK, TXQueue, statusStr, 
                twoLines=False, setDisplayMode=None, SMARTNESS_ON=False, **unused):
     tk.Frame.__init__(self, master) # explicitly initialize base class and create window
     self.master = master
 
-    self.manualSending = False # are we trying to manually send a command?
+    self.unACKed = None # (typed, sent) command waiting for an ACK
+    self.numTries = 0 # times unACKed has been resent
+    self.resendTimer = None # Tk after() id of the next resend
+    self.driving = False # is autosendCommand repeating a continuous drive command?
+    self.nextCommand = None # newest command given to sendCommand while unACKed was busy, sent by finishCommand
     self.CMDS = {'v':{'prop':"speed 0..255",'func':lambda x: str(x)                       }, # send motor speed as given
                  'w':{'prop':"forward mm",  'func':lambda x: str(int(robot.MM_2_TICK*x))  }, # convert mm to ticks
                  'a':{'prop':"left deg",    'func':lambda x: str(int(robot.DEG_2_TICK*x)) }, # convert degrees to ticks
@@ -223,75 +266,79 @@ class EntryFrame(tk.Frame):
     master.bind('<Escape>', lambda event: self.closeWin()) # escape exits program after prompt
     master.bind('<Shift-R>', lambda event: self.restartAll()) # shift and capital R does a soft reset
     self.entryBox.bind('<Return>', lambda event: self.manualSend()) # enter sends the command in the command box
+    self.entryBox.bind('<KeyRelease>', lambda event: self.autosendCommand()) # drive commands are sent as soon as they're typed
 
   def sendCommand(self, command):
+    if self.unACKed is not None: # a waypoint sent now would be lost, so it goes once the robot has the last one
+      self.nextCommand = command
+      return
     self.entryBox.delete(0,"end")
     self.entryBox.insert(0,command)
     self.manualSend()
+    self.autosendCommand()
 
   def manualSend(self):
-    self.manualSending = True
-
-  def autosendCommand(self, numTries=0, wantACK=False, strIn='', strOut=''):
-    # expecting ACK from Arduino (only for value-setting commands in 'vwasd')
-    if wantACK:
-      gotACK = self.getACK() # has the serial thread received an ACK?
-
-      # either ACK received or command resent too many times
-      if gotACK or numTries >= MAX_TX_TRIES:
-        numTries, wantACK = 0, False # reset stuff
-        self.entryBox.delete(0,"end") # clear box if we're done sending command
-        self.resetACK() # tell serial thread that we got the ACK
-
-      # no ACK received and not resent too many times
+    strIn = self.entryBox.get()
+    if self.unACKed is not None or not strIn or strIn in 'WASD': return # busy, empty, or already being sent continuously
+    command = strIn[0]
+    if command in list(self.CMDS): # we're giving the robot a value for a command
+      try:
+        num = float(strIn[1:])
+      except ValueError:
+        self.entryBox.delete(1,"end")
+        self.entryBox.insert(1,"[{}]".format(self.CMDS[command]['prop'])) # prompt user with proper command format
+        self.entryBox.selection_range(1,'end')
+      else: # re-create command with converted values (and terminate), and resend it until it's received
+        self.sendForACK(strIn, command + self.CMDS[command]['func'](num) + command)
+    elif command == 'c': # we're giving the robot a compound command
+      try:
+        ang, dist = [float(val) for val in strIn[1:].split('c')]
+      except ValueError:
+        self.entryBox.delete(1,"end")
+        self.entryBox.insert(1,"[theta]c[dist]") # prompt user with proper command format
+        self.entryBox.selection_range(1,'end')
       else:
-        numTries += 1 # keep track of how many times we're resending command
-        self.TXQueue.put(strOut) # send last command
-        self.entryBox.delete(0,"end")
-        self.entryBox.insert(0,"try {0}: {1}".format(numTries, strIn)) # tell box what we're doing
-
-    # there's a new command to send (that isn't empty)
-    elif self.entryBox.get(): # string in box isn't empty
-      strIn = self.entryBox.get() # get new command
-
-      # auto-send continuous drive commands (capitalized normal commands)
-      if strIn in 'WASD':
-        self.TXQueue.put(strIn[0])
-
-      # manual-send
-      elif self.manualSending:
-        command = strIn[0]
-        if command in list(self.CMDS): # we're giving the robot a value for a command
-          try:
-            num = float(strIn[1:])
-          except ValueError:
-            self.entryBox.delete(1,"end")
-            self.entryBox.insert(1,"[{}]".format(self.CMDS[command]['prop'])) # prompt user with proper command format
-            self.entryBox.selection_range(1,'end')
-          else:
-            wantACK = True # start resending the command if it isn't received
-            strOut = command + self.CMDS[command]['func'](num) + command # re-create command with converted values (and terminate)
-            self.TXQueue.put(strOut)
-        elif command == 'c': # we're giving the robot a compound command
-          try:
-            ang, dist = [float(val) for val in strIn[1:].split('c')]
-          except ValueError:
-            self.entryBox.delete(1,"end")
-            self.entryBox.insert(1,"[theta]c[dist]") # prompt user with proper command format
-            self.entryBox.selection_range(1,'end')
-          else:
-            wantACK = True
-            strOut = command + self.CMDS['d']['func'](ang) + command + self.CMDS['w']['func'](dist) + command
-            self.TXQueue.put(strOut)
-        else: # otherwise send only first character
-          self.TXQueue.put(command)
-          self.entryBox.delete(0,"end") # clear box
-
-      else:
-        pass # wait until manual-send for other commands
-    
-    self.manualSending = False # reset manual sending
-    self.master.after(CMD_RATE, lambda: self.autosendCommand(numTries=numTries, wantACK=wantACK, strIn=strIn, strOut=strOut))
+        self.sendForACK(strIn, command + self.CMDS['d']['func'](ang) + command + self.CMDS['w']['func'](dist) + command)
+    else: # otherwise send only first character
+      self.TXQueue.put(command)
+      self.entryBox.delete(0,"end") # clear box
+
+  def autosendCommand(self):
+    strIn = self.entryBox.get()
+    if self.unACKed is None and strIn and strIn in 'WASD':
+      if self.driving: return # already repeating
+      self.driving = True
+      self.TXQueue.put(strIn[0])
+      self.master.after(CMD_RATE, self.keepDriving)
+
+  def keepDriving(self):
+    self.driving = False
+    self.autosendCommand() # stops once the drive command is gone from the box
+
+  def sendForACK(self, strIn, strOut):
+    self.unACKed, self.numTries = (strIn, strOut), 0
+    self.TXQueue.put(strOut)
+    self.resendTimer = self.master.after(CMD_RATE, self.resendCommand)
+
+  def resendCommand(self):
+    if self.getACK() or self.numTries >= MAX_TX_TRIES: return self.finishCommand() # ACK received or resent too many times
+    self.numTries += 1 # keep track of how many times we're resending command
+    self.TXQueue.put(self.unACKed[1]) # send last command
+    self.entryBox.delete(0,"end")
+    self.entryBox.insert(0,"try {0}: {1}".format(self.numTries, self.unACKed[0])) # tell box what we're doing
+    self.resendTimer = self.master.after(CMD_RATE, self.resendCommand)
+
+  def ackReceived(self):
+    if self.unACKed is not None and self.getACK(): self.finishCommand()
+
+  def finishCommand(self):
+    self.master.after_cancel(self.resendTimer)
+    self.unACKed = None
+    self.entryBox.delete(0,"end") # clear box since we're done sending command
+    self.resetACK() # tell serial thread that we got the ACK
+    if self.nextCommand is not None:
+      command, self.nextCommand = self.nextCommand, None
+      self.sendCommand(command)
 
 
 ######################################################################################
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+# mapserver.py - streams the map to web browsers as PNG tiles, pushing only tiles that changed over a WebSocket,
+#                and exports it as a zoomable tile pyramid on disk
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from tools import PYTHON_SERIES
+if PYTHON_SERIES == 2:
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+elif PYTHON_SERIES == 3:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+from rendering import RenderThread
+from threading import Thread, Event, Lock
+from hashlib import sha1
+from base64 import b64encode
+from select import select
+import socket, struct, zlib, json, re, os
+import numpy as np
+
+TILE_SIZE = 100 # width and height of each map tile [pix]
+PYRAMID_TILE_SIZE = 256 # width and height of each exported tile, as web map viewers expect [pix]
+PUBLISH_FPS = 2 # most map updates per second to look for changed tiles in
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11' # from RFC 6455
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>SLAM Rover Map</title></head>
+<body style="background:#444; color:#eee; font-family:monospace">
+<div id="status">Connecting...</div>
+<canvas id="map" style="image-rendering:pixelated; max-width:100%"></canvas>
+<script>
+var canvas = document.getElementById('map'), context = canvas.getContext('2d');
+var tiles = document.createElement('canvas'), tileContext = tiles.getContext('2d'); // map without the robot
+var layout = null, pose = null, status = document.getElementById('status');
+var socket = new WebSocket('ws://' + location.host + '/ws');
+socket.binaryType = 'arraybuffer';
+socket.onclose = function() { status.textContent = 'Disconnected.'; };
+socket.onmessage = function(event) {
+  if (typeof event.data === 'string') {
+    var message = JSON.parse(event.data);
+    if (message.layout) {
+      layout = message.layout;
+      canvas.width = tiles.width = layout.width;
+      canvas.height = tiles.height = layout.height;
+    }
+    if (message.pose) {
+      pose = message.pose;
+      status.textContent = 'x ' + pose[0].toFixed(0) + ' pix, y ' + pose[1].toFixed(0) + ' pix, heading ' + pose[2].toFixed(1) + ' deg';
+      draw();
+    }
+  } else { // tile: row and column as big-endian uint16s, then the PNG
+    var header = new DataView(event.data, 0, 4), row = header.getUint16(0), col = header.getUint16(2);
+    var image = new Image();
+    image.onload = function() {
+      tileContext.drawImage(image, col*layout.tile, row*layout.tile);
+      URL.revokeObjectURL(image.src);
+      draw();
+    };
+    image.src = URL.createObjectURL(new Blob([event.data.slice(4)], {type: 'image/png'}));
+  }
+};
+function draw() {
+  context.drawImage(tiles, 0, 0);
+  if (!pose) return;
+  context.save();
+  context.translate(pose[0], pose[1]);
+  context.rotate(pose[2]*Math.PI/180); // heading is clockwise from up
+  context.strokeStyle = 'red';
+  context.beginPath();
+  context.moveTo(0, -8); context.lineTo(5, 6); context.lineTo(-5, 6); context.closePath();
+  context.stroke();
+  context.restore();
+}
+</script>
+</body></html>
+"""
+
+
+def encodePNG(gray): # 8-bit grayscale PNG of a 2-D uint8 array, with only the standard library
+  def chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+  rows = np.zeros((gray.shape[0], gray.shape[1]+1), dtype=np.uint8) # each row starts with filter type 0 (none)
+  rows[:,1:] = gray
+  return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', gray.shape[1], gray.shape[0], 8, 0, 0, 0, 0)) +
+          chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) + chunk(b'IEND', b''))
+
+def websocketFrame(opcode, data): # unmasked, unfragmented frame, as servers send them
+  if len(data) < 126: header = struct.pack('>BB', 0x80 | opcode, len(data))
+  elif len(data) < 65536: header = struct.pack('>BBH', 0x80 | opcode, 126, len(data))
+  else: header = struct.pack('>BBQ', 0x80 | opcode, 127, len(data))
+  return header + data
+
+
+class TilePyramid(object):
+  # writes the map as <zoom>/<col>/<row>.png tiles, zoom 0 being the whole map in one tile, and each zoom twice as detailed
+  # init     reads the tile hashes of the last export into this directory, if there was one
+  # export   writes the tiles that changed since the last export, skipping (and deleting) ones that are all blank
+  # levels   returns the map at each zoom, coarsest first, padded with blank to whole tiles
+
+  def __init__(self, directory, tileSize=PYRAMID_TILE_SIZE, blank=127):
+    self.directory, self.tileSize, self.blank = directory, tileSize, blank
+    self.manifestPath = os.path.join(directory, 'tiles.json') # sizes, and the crc32 of every tile written
+    try:
+      with open(self.manifestPath) as manifest: manifest = json.load(manifest)
+    except (IOError, ValueError): manifest = {} # nothing exported here yet
+    sameFormat = manifest.get('tileSize') == tileSize and manifest.get('blank') == blank
+    self.hashes = manifest.get('hashes', {}) if sameFormat else {} # tile path: crc32
+
+  def export(self, mapMatrix): # returns the number of tiles written
+    t = self.tileSize
+    hashes, written = {}, 0
+    levels = self.levels(mapMatrix)
+    for zoom, level in enumerate(levels):
+      for row in range(level.shape[0]//t):
+        for col in range(level.shape[1]//t):
+          tile = level[row*t:(row+1)*t, col*t:(col+1)*t]
+          if (tile == self.blank).all(): continue # nothing mapped here
+          path = '{0:d}/{1:d}/{2:d}.png'.format(zoom, col, row)
+          hashes[path] = zlib.crc32(tile.tobytes())
+          if self.hashes.get(path) == hashes[path]: continue # unchanged since the last export
+          filepath = os.path.join(self.directory, path)
+          if not os.path.isdir(os.path.dirname(filepath)): os.makedirs(os.path.dirname(filepath))
+          with open(filepath, 'wb') as f: f.write(encodePNG(tile))
+          written += 1
+    for path in set(self.hashes) - set(hashes): # tiles that went blank, or zooms that no longer exist
+      try: os.remove(os.path.join(self.directory, path))
+      except OSError: pass
+    self.hashes = hashes
+
+    with open(self.manifestPath, 'w') as manifest:
+      json.dump({'tileSize': t, 'blank': self.blank, 'width': mapMatrix.shape[1], 'height': mapMatrix.shape[0],
+                 'zooms': len(levels), 'hashes': hashes}, manifest)
+    print("Wrote {0:d} of {1:d} map tiles to {2:s}".format(written, len(hashes), self.directory))
+    return written
+
+  def levels(self, mapMatrix):
+    t = self.tileSize
+    level = np.asarray(mapMatrix, dtype=np.uint8)
+    levels = []
+    while True:
+      shape = max(-(-level.shape[0]//t), 1)*t, max(-(-level.shape[1]//t), 1)*t # whole tiles
+      padded = np.full(shape, self.blank, dtype=np.uint8)
+      padded[:level.shape[0], :level.shape[1]] = level
+      levels.append(padded)
+      if shape == (t, t): return levels[::-1]
+      # halve with the darkest of each 2x2 block, so thin walls don't fade away when zoomed out
+      level = padded.reshape(shape[0]//2, 2, shape[1]//2, 2).min(axis=3).min(axis=1)
+
+
+class MapClient(object):
+  # one WebSocket connection's undelivered changes, merged so a slow link only ever gets the newest version of each tile
+  # init   starts with nothing to send
+  # add    merges in a new layout, changed tiles and/or pose, and wakes the connection
+  # take   returns and clears everything waiting to be sent
+
+  def __init__(self):
+    self.lock = Lock()
+    self.waiting = Event()
+    self.layout, self.tiles, self.pose = None, set(), None
+
+  def add(self, layout=None, tiles=(), pose=None):
+    with self.lock:
+      if layout is not None: self.layout, self.tiles = layout, set() # a new layout replaces every tile
+      self.tiles.update(tiles)
+      if pose is not None: self.pose = pose
+    self.waiting.set()
+
+  def take(self):
+    with self.lock:
+      waiting = self.layout, sorted(self.tiles), self.pose
+      self.layout, self.tiles, self.pose = None, set(), None
+      self.waiting.clear()
+    return waiting
+
+
+class MapServer(object):
+  # init         sets up the tile state and HTTP server, without starting anything
+  # start        serves HTTP and publishes map updates, each on its own thread
+  # stop         shuts both down
+  # publish      hands over a map snapshot and robot pose in its pixels (from getMapSnapshot), dropping any not yet looked at
+  # update       on the publisher thread, hashes the tiles and tells every client which ones changed
+  # makeLayout   returns the map and tile sizes for clients, with the lock already held
+  # getLayout    returns them from any thread, or None before the first map
+  # getTile      returns the PNG of a tile, encoding it only once per change
+  # addClient    returns a new MapClient that is sent the whole map, then every change
+  # removeClient stops sending changes to a client
+
+  def __init__(self, host='localhost', port=8080, tileSize=TILE_SIZE, fps=PUBLISH_FPS):
+    self.tileSize = tileSize
+    self.lock = Lock() # guards everything below, which the publisher and connection threads share
+    self.map = None # newest map snapshot
+    self.hashes = None # crc32 of each tile of it
+    self.pose = None
+    self.pngs = {} # (row, col): (hash, PNG bytes) of tiles encoded so far
+    self.clients = set()
+
+    self.publisher = RenderThread(self.update, fps, 'Publishing map tiles')
+    self.httpServer = MapHTTPServer((host, port), MapRequestHandler)
+    self.httpServer.mapServer = self
+    self.httpThread = Thread(target=self.httpServer.serve_forever)
+    self.httpThread.daemon = True
+    self.stopped = Event()
+
+  def start(self):
+    self.publisher.start()
+    self.httpThread.start()
+    print("Serving the map at http://{0:s}:{1:d}/".format(*self.httpServer.server_address[0:2]))
+
+  def stop(self):
+    self.stopped.set()
+    self.publisher.stop()
+    self.httpServer.shutdown()
+    self.httpServer.server_close()
+
+  def publish(self, mapMatrix, pose):
+    self.publisher.submit((mapMatrix, pose))
+
+  def update(self, snapshot):
+    mapMatrix, pose = snapshot
+    t = self.tileSize
+    rows, cols = -(-mapMatrix.shape[0]//t), -(-mapMatrix.shape[1]//t) # partial tiles at the far edges
+    hashes = np.array([[zlib.crc32(mapMatrix[r*t:(r+1)*t, c*t:(c+1)*t].tobytes()) for c in range(cols)] for r in range(rows)])
+    with self.lock:
+      newLayout = self.map is None or self.map.shape != mapMatrix.shape
+      changed = [] if newLayout else list(zip(*np.nonzero(hashes != self.hashes)))
+      self.map, self.hashes, self.pose = mapMatrix, hashes, pose
+      layout = self.makeLayout() if newLayout else None
+      for client in self.clients:
+        if newLayout: client.add(layout, self.allTiles(), pose)
+        else: client.add(tiles=changed, pose=pose)
+
+  def allTiles(self):
+    return [(r, c) for r in range(self.hashes.shape[0]) for c in range(self.hashes.shape[1])]
+
+  def makeLayout(self):
+    return {'width': self.map.shape[1], 'height': self.map.shape[0], 'tile': self.tileSize,
+            'rows': self.hashes.shape[0], 'cols': self.hashes.shape[1]}
+
+  def getLayout(self):
+    with self.lock: return None if self.map is None else self.makeLayout()
+
+  def getTile(self, row, col): # returns None if there is no such tile
+    with self.lock:
+      if self.map is None or not (0 <= row < self.hashes.shape[0] and 0 <= col < self.hashes.shape[1]): return None
+      tileHash = self.hashes[row, col]
+      cached = self.pngs.get((row, col))
+      if cached is None or cached[0] != tileHash:
+        t = self.tileSize
+        cached = self.pngs[(row, col)] = (tileHash, encodePNG(self.map[row*t:(row+1)*t, col*t:(col+1)*t]))
+      return cached[1]
+
+  def addClient(self):
+    client = MapClient()
+    with self.lock:
+      self.clients.add(client)
+      if self.map is not None: client.add(self.makeLayout(), self.allTiles(), self.pose)
+    return client
+
+  def removeClient(self, client):
+    with self.lock: self.clients.discard(client)
+
+
+class MapHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True # don't keep the program alive for open connections
+  allow_reuse_address = True
+
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+  # serves the viewer page at /, tiles at /tiles/<row>/<col>.png, the layout at /layout.json, and pushes changes on /ws
+  # do_GET        routes requests
+  # sendBytes     sends a whole response
+  # streamChanges upgrades the connection to a WebSocket and sends changes until either side stops
+  # isClosing     checks without blocking whether the browser closed the WebSocket
+
+  protocol_version = 'HTTP/1.1' # browsers only upgrade HTTP/1.1 connections to WebSockets
+
+  def do_GET(self):
+    server = self.server.mapServer
+    tile = re.match(r'^/tiles/(\d+)/(\d+)\.png$', self.path)
+    layout = server.getLayout() if self.path == '/layout.json' else None
+    png = server.getTile(int(tile.group(1)), int(tile.group(2))) if tile else None
+    if self.path == '/': self.sendBytes(PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+    elif self.path == '/ws': self.streamChanges(server)
+    elif layout is not None: self.sendBytes(json.dumps(layout).encode('ascii'), 'application/json')
+    elif png is not None: self.sendBytes(png, 'image/png')
+    else: self.send_error(404)
+
+  def sendBytes(self, data, contentType):
+    self.send_response(200)
+    self.send_header('Content-Type', contentType)
+    self.send_header('Content-Length', str(len(data)))
+    self.send_header('Cache-Control', 'no-cache')
+    self.end_headers()
+    self.wfile.write(data)
+
+  def streamChanges(self, server):
+    key = self.headers.get('Sec-WebSocket-Key')
+    if not key: return self.send_error(400)
+    self.send_response(101)
+    self.send_header('Upgrade', 'websocket')
+    self.send_header('Connection', 'Upgrade')
+    self.send_header('Sec-WebSocket-Accept', b64encode(sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii'))
+    self.end_headers()
+    self.wfile.flush()
+
+    client = server.addClient()
+    try:
+      while not server.stopped.isSet() and not self.isClosing():
+        if not client.waiting.wait(1.0): continue
+        layout, tiles, pose = client.take()
+        if layout is not None: self.wfile.write(websocketFrame(0x1, json.dumps({'layout': layout}).encode('ascii')))
+        for row, col in tiles: # binary frame: row and column, then the PNG
+          png = server.getTile(row, col)
+          if png is None: continue # the map changed shape since, and a new layout with all its tiles is on its way
+          self.wfile.write(websocketFrame(0x2, struct.pack('>HH', row, col) + png))
+        if pose is not None: self.wfile.write(websocketFrame(0x1, json.dumps({'pose': pose}).encode('ascii')))
+        self.wfile.flush()
+    except socket.error: pass # browser went away
+    finally:
+      server.removeClient(client)
+      self.close_connection = True
+
+  def isClosing(self): # anything the browser sends besides a close frame (pings, say) is ignored
+    if not select([self.connection], [], [], 0)[0]: return False
+    received = self.connection.recv(4096)
+    return not received or (bytearray(received)[0] & 0x0F) == 0x8 # disconnected, or close frame
+
+  def log_message(self, format, *args):
+    pass # one line per tile request would flood the console
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# rendering.py - draws map frames on their own thread, at a steady frame rate, so slow displays don't hold up SLAM
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from threading import Thread, Event, Lock
+from time import time
+
+REPORT_PERIOD = 10.0 # time between printing the achieved frame rate [s], 0 for never
+
+
+class RenderThread(Thread):
+  # init      takes the function that draws a frame, the most frames to draw per second, and what to call it in reports
+  # stop      ends the render loop
+  # submit    hands over a frame to draw, replacing (dropping) any frame still waiting
+  # getStats  returns the achieved frames per second and the number of frames dropped, since the last call
+  # run       draws the newest frame whenever one is waiting and the frame rate allows
+
+  def __init__(self, render, fps=10, label='Rendering'):
+    super(RenderThread, self).__init__()
+    self.daemon = True # don't keep the program alive
+    self.render = render # called on this thread with each frame, which it must not share with the caller
+    self.period = 1.0/fps # [s]
+    self.label = label
+    self.frame = None # newest frame not yet drawn
+    self.lock = Lock() # guards frame and the counts
+    self.waiting = Event() # is there a frame to draw?
+    self.drawn, self.dropped = 0, 0
+    self.statsTime = time()
+    self._stop = Event()
+
+  def stop(self):
+    self._stop.set()
+    self.waiting.set() # wake the loop so it sees the flag
+
+  def submit(self, frame):
+    with self.lock:
+      if self.frame is not None: self.dropped += 1 # never drawn, since a newer one came first
+      self.frame = frame
+    self.waiting.set()
+
+  def getStats(self):
+    with self.lock:
+      now = time()
+      fps = self.drawn/max(now - self.statsTime, 1e-6)
+      dropped = self.dropped
+      self.drawn, self.dropped, self.statsTime = 0, 0, now
+    return fps, dropped
+
+  def run(self):
+    lastReport = time()
+    while not self._stop.isSet():
+      self.waiting.wait()
+      with self.lock:
+        frame, self.frame = self.frame, None
+        self.waiting.clear()
+      if frame is None: continue # woken to stop
+      start = time()
+      self.render(frame)
+      with self.lock: self.drawn += 1
+
+      if REPORT_PERIOD and start - lastReport > REPORT_PERIOD:
+        print("{0:s} at {1:.1f} fps, {2:d} frames dropped".format(self.label, *self.getStats()))
+        lastReport = start
+      self._stop.wait(max(self.period - (time() - start), 0)) # governor: no faster than fps
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# saving.py - writes map snapshots to files in a background thread, so saving doesn't stop the data loop
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# note that writeSnapshot() imports PIL only for PNGs, and viewImage() imports subprocess
+from tools import PYTHON_SERIES
+if PYTHON_SERIES == 2: from Queue import Queue, Empty as QueueEmpty
+elif PYTHON_SERIES == 3: from queue import Queue, Empty as QueueEmpty
+from threading import Thread, Event
+import time, os
+import numpy as np
+
+SAVE_FORMATS = ('png', 'pgm', 'npz') # color image with the robot's path, plain grayscale map, or every array for numpy
+
+
+def writeSnapshot(snapshot, format='png', directory=''): # writes a DataMatrix.getSnapshot() and returns the file's path
+  if format not in SAVE_FORMATS: raise ValueError("Can't save maps as " + format + ", only as " + ", ".join(SAVE_FORMATS))
+  filename = time.strftime('%Y-%m-%dT%Hh%Mm%Ss', snapshot['time']) + "_" + str(int(snapshot['mapSize_m'])) + "meters." + format
+  filepath = os.path.join(directory, filename)
+  mapMatrix = snapshot['map']
+
+  if format == 'png':
+    from PIL import Image # don't have PIL? sorry (try pypng, or another format)
+    image = np.empty(mapMatrix.shape + (3,), dtype=np.uint8) # map in every color layer
+    image[...] = mapMatrix[:,:,np.newaxis]
+    image[snapshot['robot']] = (255, 0, 0) # robot and its path in red
+    Image.fromarray(image).save(filepath)
+  elif format == 'pgm': # binary graymap, readable by most map tools without PIL
+    with open(filepath, 'wb') as f:
+      f.write("P5\n{0:d} {1:d}\n255\n".format(mapMatrix.shape[1], mapMatrix.shape[0]).encode('ascii'))
+      f.write(np.ascontiguousarray(mapMatrix, dtype=np.uint8).tobytes())
+  elif format == 'npz':
+    np.savez_compressed(filepath, **dict((key, value) for key, value in snapshot.items() if key != 'time'))
+  return filepath
+
+def viewImage(filepath): # opens the image without waiting for the viewer to close
+  import subprocess # used to display the image (not necessary for save)
+  try: subprocess.Popen(["eog", filepath]) # open with eye of gnome
+  except OSError: print("Couldn't open " + filepath + " with eog")
+
+
+class SaveThread(Thread):
+  # init          creates the job and result queues for the worker
+  # stop          ends the worker loop, once the jobs already submitted are done
+  # submit        hands the worker a function to run, and what to call with its result and error when it's done
+  # runCallbacks  calls back for every finished job, on the calling thread (so call it from the Tk loop)
+  # run           runs jobs until stopped, calling notify (on this thread) after each, so root knows to run the callbacks
+
+  def __init__(self, notify=None):
+    super(SaveThread, self).__init__()
+    self.daemon = True # don't keep the program alive (join it to let saves finish)
+    self.jobs, self.results = Queue(), Queue()
+    self.notify = notify if notify is not None else lambda: None
+    self._stop = Event()
+
+  def stop(self):
+    self._stop.set()
+    self.jobs.put(None) # wake the worker, after the jobs already waiting
+
+  def submit(self, job, done=None): # job must only use data that isn't changed afterwards, like a snapshot
+    self.jobs.put((job, done))
+
+  def runCallbacks(self):
+    while True:
+      try: done, result, error = self.results.get_nowait()
+      except QueueEmpty: return
+      if done is not None: done(result, error)
+
+  def run(self):
+    while not (self._stop.isSet() and self.jobs.empty()):
+      queued = self.jobs.get() # blocks, rather than polling, until there's a job
+      if queued is None: continue # woken to stop
+      job, done = queued
+      try: self.results.put((done, job(), None))
+      except Exception as error: # reported through the callback instead of killing the worker
+        print("Saving failed: " + str(error))
+        self.results.put((done, None, error))
+      self.notify()
@@ -20,18 +20,69 @@
 
 from tools import coerceToRange
 from breezyslam.algorithms import RMHC_SLAM
+import numpy as np
+import time
 
 HOLE_WIDTH_MM = 200
 RANDOM_SEED = 0xabcd
 
+GAP_MAX_JUMP = 0.1 # only fill gaps between bins whose distances differ by less than this fraction (don't bridge doorways)
+
+TELEMETRY_LEN = 1024 # number of most recent scans to keep telemetry for
+TELEMETRY_DTYPE = np.dtype([('scan',        np.int32),   # scan number since start
+                            ('valid',       np.int16),   # scan points with a distance reading
+                            ('obstacles',   np.int16),   # scan points used for matching
+                            ('iterations',  np.int32),   # RMHC mutations tried
+                            ('evaluations', np.int32),   # scan-to-map distance evaluations
+                            ('score',       np.int32),   # final scan-to-map distance, lower is better, -1 for none
+                            ('search_ms',   np.float32), # time spent matching scan to map [ms]
+                            ('map_ms',      np.float32), # time spent integrating scan into map [ms]
+                            ('total_ms',    np.float32), # time spent in updateSlam [ms]
+                            ('odometry',    np.bool_)])  # whether encoder data was used as starting guess
+
+
+def deskewScan(points, times, startTime, endTime, velocities, offset_mm=0):
+  # moves each scan point to where it would have been seen from the robot's pose at the end of the scan
+  # points is (N,2) distance [mm], angle [deg]; times are when each point arrived [s]
+  # startTime and endTime bracket the scan [s]; velocities is robot motion over that time (dxy [mm], dtheta [deg], ...)
+  # assumes constant velocities during the scan, so pose at each point is linearly interpolated in time
+  points = np.asarray(points, dtype=float)
+  if len(points) == 0 or endTime <= startTime: return points
+  dist, ang = points[:,0], np.radians(points[:,1])
+
+  remaining = 1.0 - np.clip((np.asarray(times, dtype=float) - startTime)/(endTime - startTime), 0.0, 1.0) # motion left after point
+  phi = np.radians(-remaining*velocities[1]) # heading at point wrt heading at end [rad] # positive is clockwise
+  travel = -remaining*velocities[0] # position at point wrt position at end, along chord of arc [mm]
+
+  xr, yr = dist*np.sin(ang), offset_mm + dist*np.cos(ang) # point wrt robot center at time of point (x right, y forward)
+  s, c = np.sin(phi), np.cos(phi)
+  xe = travel*np.sin(phi/2) + c*xr + s*yr # point wrt robot center at end of scan
+  ye = travel*np.cos(phi/2) - s*xr + c*yr - offset_mm # point wrt laser at end of scan
+
+  deskewed = np.empty_like(points)
+  deskewed[:,0] = np.where(dist > 0, np.hypot(xe, ye), dist) # leave empty readings empty
+  deskewed[:,1] = np.where(dist > 0, np.degrees(np.arctan2(xe, ye)) % 360, points[:,1])
+  return deskewed
+
+
 class Slam(RMHC_SLAM):
   # init          creates the BreezySLAM objects needed for mapping
   # getBreezyMap  returns BreezySLAM's current internal map
   # updateSlam    takes LIDAR data and uses BreezySLAM to calculate the robot's new position
+  # buildScan     turns an array of (distance, angle) points into BreezySLAM's scan vector
+  # fillGaps      interpolates short runs of empty bins in a scan vector
   # getVelocities uses encoder data to return robot position deltas, is only run if USE_ODOMETRY
+  # getSearchStats returns iterations and evaluations used by the last RMHC search, and its final score
+  # getTelemetry  returns per-scan telemetry records for the most recent scans, oldest first
+  # deskewScan    undoes motion blur from the robot moving during a scan, using encoder data, is only run if DESKEW_SCANS and USE_ODOMETRY
 
-  def __init__(self, robot, laser, logFile=None, MAP_SIZE_M=8.0, MAP_RES_PIX_PER_M=100, USE_ODOMETRY=True, MAP_QUALITY=5, **unused):
+  def __init__(self, robot, laser, logFile=None, MAP_SIZE_M=8.0, MAP_RES_PIX_PER_M=100, USE_ODOMETRY=True, MAP_QUALITY=5,
+               SEARCH_SCORE_THRESHOLD=-1, SEARCH_MIN_SIGMA_XY_MM=0, SEARCH_MIN_SIGMA_THETA_DEG=0, SEARCH_TIME_US=0, DESKEW_SCANS=False,
+               SCAN_AGGREGATE='last', SCAN_GAP_BINS=0, **unused):
     self.USE_ODOMETRY = USE_ODOMETRY
+    self.DESKEW_SCANS = DESKEW_SCANS
+    self.SCAN_AGGREGATE = SCAN_AGGREGATE # how to combine points in the same bin: 'last', 'min' or 'median'
+    self.SCAN_GAP_BINS = SCAN_GAP_BINS # longest run of empty bins to fill by interpolation, 0 for none
     MAP_SIZE_PIXELS = int(MAP_SIZE_M*MAP_RES_PIX_PER_M) # number of pixels across the entire map
     RMHC_SLAM.__init__(self, \
                        laser, \
@@ -39,7 +90,11 @@ class Slam(RMHC_SLAM):
                        MAP_SIZE_M, \
                        MAP_QUALITY, \
                        HOLE_WIDTH_MM, \
-                       RANDOM_SEED)
+                       RANDOM_SEED, \
+                       score_threshold=SEARCH_SCORE_THRESHOLD, \
+                       min_sigma_xy_mm=SEARCH_MIN_SIGMA_XY_MM, \
+                       min_sigma_theta_degrees=SEARCH_MIN_SIGMA_THETA_DEG, \
+                       max_search_time_us=SEARCH_TIME_US)
 
     self.robot = robot
     self.scanSize = laser.SCAN_SIZE
@@ -47,32 +102,95 @@ class Slam(RMHC_SLAM):
 
     self.prevEncPos = () # robot encoder data
     self.currEncPos = () # left wheel [ticks], right wheel [ticks], timestamp [ms]
+    self.prevEncTime = None # time encoder data was received [s]
+    self.currEncTime = None
+    self.scanDeskewed = False # has the current scan already been corrected for robot motion?
 
     self.breezyMap = bytearray(MAP_SIZE_PIXELS**2) # initialize map array for BreezySLAM's internal mapping
 
+    self.telemetry = np.zeros(TELEMETRY_LEN, dtype=TELEMETRY_DTYPE) # ring of per-scan records, written in place
+    self.numScans = 0 # total number of scans processed (next telemetry record is at numScans % TELEMETRY_LEN)
+
   def getBreezyMap(self):
     return self.breezyMap
 
   def updateSlam(self, points): # 15ms
-    distVec = [0 for i in range(self.scanSize)]
-
-    for point in points: # create breezySLAM-compatible data from raw scan data
-      dist = point[0]
-      index = int(point[1])
-      if not 0 <= index < self.scanSize: continue
-      distVec[index] = int(dist)
+    tstart = time.time()
+    distVec = self.buildScan(points)
 
     # note that breezySLAM switches the x- and y- axes (their x is forward, 0deg; y is right, +90deg)
-    if self.logFile: self.logFile.write(' '.join((str(el) for el in list(self.currEncPos)+distVec)) + '\n')
-    distVec = [distVec[i-180] for i in range(self.scanSize)] # rotate scan data so middle of vector is straight ahead, 0deg
-    self.update(distVec, self.getVelocities() if self.USE_ODOMETRY else None) # 10ms
+    if self.logFile: np.savetxt(self.logFile, np.concatenate((self.currEncPos, distVec))[np.newaxis], fmt='%d')
+    distVec = np.roll(distVec, self.scanSize//2) # rotate scan data so middle of vector is straight ahead, 0deg
+    stats = self.update(distVec, self.getVelocities() if self.USE_ODOMETRY else None) # 10ms
+    self.scanDeskewed = False
     x, y, theta = self.getpos()
 
     self.getmap(self.breezyMap) # write internal map to breezyMap
 
+    self.telemetry[self.numScans % TELEMETRY_LEN] = (self.numScans, stats.valid_points, stats.obstacle_points,
+      self.search_iterations, stats.evaluations, stats.score, 1000*stats.search_seconds, 1000*stats.map_update_seconds,
+      1000*(time.time()-tstart), stats.used_odometry)
+    self.numScans += 1
+
     return (y, x, coerceToRange(theta, (-180.0,180.0), wrapAround=True))
 
+  def buildScan(self, points):
+    # bin (distance, angle) points into a contiguous int32 vector of distances, scanSize bins per revolution
+    # points sharing a bin are combined according to SCAN_AGGREGATE, out-of-range angles are dropped
+    points = np.asarray(points, dtype=float).reshape(-1,2)
+    index = np.floor(points[:,1]*(self.scanSize/360.0)).astype(np.intp) # bin of each point
+    valid = (0 <= index) & (index < self.scanSize) & (points[:,0] > 0)
+    index, dist = index[valid], points[valid,0]
+    distVec = np.zeros(self.scanSize, dtype=np.int32)
+
+    if self.SCAN_AGGREGATE == 'last' or len(dist) == 0:
+      distVec[index] = dist # later points overwrite earlier ones # cast to int32 truncates, same as int()
+    else:
+      order = np.lexsort((dist, index)) # sort by bin, then by distance within bin
+      index, dist = index[order], dist[order]
+      bins, starts, counts = np.unique(index, return_index=True, return_counts=True)
+      if self.SCAN_AGGREGATE == 'min':
+        distVec[bins] = dist[starts]
+      elif self.SCAN_AGGREGATE == 'median':
+        distVec[bins] = (dist[starts+(counts-1)//2] + dist[starts+counts//2])/2
+      else:
+        raise ValueError("SCAN_AGGREGATE must be 'last', 'min' or 'median', not {0!r}".format(self.SCAN_AGGREGATE))
+
+    if self.SCAN_GAP_BINS: self.fillGaps(distVec, self.SCAN_GAP_BINS)
+    return distVec
+
+  def fillGaps(self, distVec, maxGap):
+    # linearly interpolate runs of at most maxGap empty bins between similar distances, in place, wrapping around 360deg
+    n = len(distVec)
+    full = distVec > 0
+    if full.all() or not full.any(): return
+    idx2 = np.arange(2*n)
+    full2 = np.concatenate((full, full))
+    before = np.maximum.accumulate(np.where(full2, idx2, -1))[n:] - n # last full bin at or before each bin (may be negative)
+    after = np.minimum.accumulate(np.where(full2, idx2, 2*n)[::-1])[::-1][:n] # first full bin at or after each bin (may be >= n)
+    dPrev, dNext = distVec[before % n].astype(float), distVec[after % n].astype(float)
+    fill = ~full & (after-before-1 <= maxGap) & (np.abs(dNext-dPrev) <= GAP_MAX_JUMP*np.minimum(dPrev, dNext))
+    frac = (np.arange(n)-before)/np.maximum(after-before, 1).astype(float) # full bins have before == after
+    distVec[fill] = (dPrev + frac*(dNext-dPrev))[fill]
+
+  def getSearchStats(self):
+    return self.search_iterations, self.search_evaluations, self.search_score
+
+  def getTelemetry(self):
+    if self.numScans <= TELEMETRY_LEN: return self.telemetry[:self.numScans].copy()
+    return np.roll(self.telemetry, -(self.numScans % TELEMETRY_LEN)) # oldest record first
+
+  def deskewScan(self, points, times):
+    if not (self.DESKEW_SCANS and self.USE_ODOMETRY) or self.prevEncTime is None or self.currEncTime is None: return points
+    velocities = self.robot.getVelocities(self.currEncPos, self.prevEncPos) # doesn't advance prevEncPos, getVelocities does
+    self.scanDeskewed = True
+    return deskewScan(points, times, self.prevEncTime, self.currEncTime, velocities, self.laser.offset_mm)
+
+  def _scan_update(self, scan, lidar): # BreezySLAM's per-ray motion correction would undo deskewScan
+    scan.update(scans_mm=lidar, hole_width_mm=self.hole_width_mm, velocities=(0,0,0) if self.scanDeskewed else self.velocities)
+
   def getVelocities(self):
     velocities = self.robot.getVelocities(self.currEncPos, self.prevEncPos)
     self.prevEncPos = self.currEncPos
+    self.prevEncTime = self.currEncTime
     return velocities
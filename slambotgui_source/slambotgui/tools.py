@@ -19,13 +19,21 @@
 
 
 from math import sin, cos, degrees, radians
-from matplotlib.lines import Line2D
+from heapq import heappush, heappop, heapreplace
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from time import time, sleep
+from collections import deque
+from select import select
 
-import sys
+import sys, os, errno
 PYTHON_SERIES = sys.version_info[0]
 
 from os.path import isfile
 
+CAN_SELECT_PIPES = os.name != 'nt' # Windows can only select() sockets, so loops there check for posted functions every POST_POLL_RATE
+POST_POLL_RATE = 10 # [ms]
+
 
 # Python tools
 if PYTHON_SERIES == 3: raw_input = lambda inStr: input(inStr)
@@ -55,18 +63,104 @@ def askForFile(filePath, mode):
     sys.exit("Please check permissions.")
 
 
+# Headless tools
+class PostQueue(object):
+  # functions posted from any thread, to be run by the thread of one event loop, which waits on a pipe to know when to run them
+  # init       makes the queue, and the pipe that's readable while anything is waiting in it
+  # post       (any thread) queues func, and wakes the loop
+  # fileno     the readable end of the pipe, for select() or Tk's createfilehandler
+  # runPosted  (loop thread) runs every function posted so far
+
+  def __init__(self):
+    self.funcs = deque() # appends and pops are thread-safe
+    self.readEnd, self.writeEnd = os.pipe()
+    if CAN_SELECT_PIPES:
+      import fcntl
+      for end in (self.readEnd, self.writeEnd): fcntl.fcntl(end, fcntl.F_SETFL, fcntl.fcntl(end, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+  def post(self, func):
+    self.funcs.append(func)
+    if CAN_SELECT_PIPES:
+      try: os.write(self.writeEnd, b'.')
+      except OSError as error:
+        if error.errno != errno.EAGAIN: raise # a full pipe will wake the loop anyway
+
+  def fileno(self):
+    return self.readEnd
+
+  def runPosted(self):
+    if CAN_SELECT_PIPES:
+      try:
+        while os.read(self.readEnd, 4096): pass # empty the pipe first, so anything posted from now on wakes the loop again
+      except OSError as error:
+        if error.errno != errno.EAGAIN: raise
+    while self.funcs: self.funcs.popleft()()
+
+class EventLoop(object):
+  # stands in for the Tk root when there is no display, calling functions at set times like Tk's after(), or when posted
+  # after     calls func once, ms milliseconds from now
+  # post      (any thread) calls func on the loop's thread as soon as it's free
+  # mainloop  calls functions as they come due or are posted, sleeping in between, until quit
+  # quit      ends mainloop
+  # update    does nothing, since there's nothing to redraw
+
+  def __init__(self):
+    self.timers = [] # heap of (due time [s], order added, func)
+    self.added = 0 # keeps functions due at the same time in order
+    self.posted = PostQueue()
+    self.post = self.posted.post
+    self.running = False
+
+  def after(self, ms, func):
+    heappush(self.timers, (time() + ms/1000.0, self.added, func))
+    self.added += 1
+
+  def mainloop(self):
+    self.running = True
+    while self.running:
+      wait = max(self.timers[0][0] - time(), 0) if self.timers else None # nothing due, so wait for a post
+      if CAN_SELECT_PIPES: select([self.posted], [], [], wait) # sleeps until a post or the next timer (Ctrl-C still works)
+      else: sleep(min(wait, POST_POLL_RATE/1000.0) if wait is not None else POST_POLL_RATE/1000.0)
+      self.posted.runPosted()
+      while self.running and self.timers and self.timers[0][0] <= time(): heappop(self.timers)[2]()
+
+  def quit(self):
+    self.running = False
+
+  def update(self):
+    pass
+
+class TextVar(object):
+  # stands in for Tk's StringVar when there is no display, printing each new value instead of showing it
+
+  def __init__(self):
+    self.last = '' # last value printed
+
+  def get(self): # callers pad new values to this length, which only matters for a fixed-width label
+    return ''
+
+  def set(self, value):
+    if value.strip() != self.last: print(value.strip()) # status strings are often repeated
+    self.last = value.strip()
+
+
 # Drawing tools
 ROBOT_WIDTH = 0.227 # [m]
 ROBOT_HEIGHT = 0.237
 left, right, bottom, top = -ROBOT_WIDTH/2, ROBOT_WIDTH/2, -ROBOT_HEIGHT/2, ROBOT_HEIGHT/2
 ROBOT = [(0,top), (left,bottom), (right,bottom), (0,top)]
-def drawMarker(ax, pos, destination=None): # input is mm
+def markerPoints(pos, destination=None): # input is mm, output is m
   x_abs, y_abs, th = pos[0]/1000.0, pos[1]/1000.0, radians(pos[2])
   s, c = sin(th), cos(th)
   robot = ROBOT # robot sprite
   robot = [(c*x+s*y+x_abs, -s*x+c*y+y_abs) for x, y in robot] # rotate and shift robot sprite to current position
   robot.append((destination[0]/1000.0, destination[1]/1000.0) if destination else (x_abs, y_abs)) # add absolute destination coordinates
-  return ax.add_line(Line2D(*zip(*robot), color='red', alpha= 0.7, linewidth=1.0)) # those *args sure do look cool
+  return zip(*robot) # xs, ys
+def drawMarker(ax, pos, destination=None): # input is mm
+  from matplotlib.lines import Line2D # only needed with a display, so matplotlib isn't loaded when HEADLESS
+  return ax.add_line(Line2D(*markerPoints(pos, destination), color='red', alpha= 0.7, linewidth=1.0)) # those *args sure do look cool
+def moveMarker(marker, pos, destination=None): # reuses a marker from drawMarker instead of replacing it
+  marker.set_data(*markerPoints(pos, destination))
 def removeMarkers(markers):
   for i in range(len(markers)):
     markers[i].remove()
@@ -74,6 +168,42 @@ def removeMarkers(markers):
 
 
 # Matrix tools
+class GrowingArray(object):
+  # init     allocates room for rows of width values (or single values, if width is None), doubling whenever it runs out
+  # reserve  makes room for more rows
+  # append   adds one row
+  # extend   adds an array of rows
+  # view     returns the rows added so far, without copying (until the next append)
+
+  def __init__(self, width=None, dtype=float, capacity=64):
+    self.data = np.empty((capacity,) if width is None else (capacity, width), dtype=dtype)
+    self.length = 0
+
+  def __len__(self):
+    return self.length
+
+  def __getitem__(self, index):
+    return self.view()[index]
+
+  def reserve(self, extra): # makes room for extra more rows, copying everything only when doubling
+    if self.length + extra > len(self.data):
+      data = np.empty((max(2*len(self.data), self.length + extra),) + self.data.shape[1:], dtype=self.data.dtype)
+      data[:self.length] = self.data[:self.length]
+      self.data = data
+
+  def append(self, row):
+    self.reserve(1)
+    self.data[self.length] = row
+    self.length += 1
+
+  def extend(self, rows):
+    self.reserve(len(rows))
+    self.data[self.length:self.length+len(rows)] = rows
+    self.length += len(rows)
+
+  def view(self):
+    return self.data[:self.length]
+
 def shrinkTo(data, rows, cols): # from http://stackoverflow.com/a/10685869
   shrunk = data.reshape(rows, data.shape[0]/rows, cols, data.shape[1]/cols).sum(axis=1).sum(axis=2)
   return shrunk*255/shrunk.max()
@@ -87,21 +217,14 @@ class Feature(object):
     self.size = self.hgt + self.wid # [pix]
     self.rLims = bounds[0] # min and max row indices in this feature
     self.cLims = bounds[1] # min and max column indices in this feature
-  # def getOverlap(self, that): # makes doesOverlap a LOT faster # not done yet...
-
-  #   return slice(self.rLims, , None), slice(, , None)
   def isAdjacentTo(self, that): # dumb check of two features for overlap or adjacency of domains
     return not (self.rLims[1]<that.rLims[0] or self.rLims[0]>that.rLims[1] or self.cLims[1]<that.cLims[0] or self.cLims[0]>that.cLims[1])
   def isSeparateFrom(self, that):
     return self.rLims[1]<=that.rLims[0] or self.rLims[0]>=that.rLims[1] or self.cLims[1]<=that.cLims[0] or self.cLims[0]>=that.cLims[1]
-  def doesOverlap(self, that):
+  def doesOverlap(self, that): # for whole tables of features at once, see frontiers.FeatureTable.findPairs
     if self.isSeparateFrom(that): return False
-    overlap = getOverlap(self, that)
-    for point1 in zip(*self.coords):
-      for point2 in zip(*that.coords):
-        if point1 == point2:
-          return True
-    return False
+    points = set(zip(*self.coords)) # hash one feature's points so each of the other's is a constant-time lookup
+    return any(point in points for point in zip(*that.coords))
 
 
 # Geometry tools
@@ -140,69 +263,312 @@ def paddedStr(inStr, length):
 
 
 # Pathfinding tools
+def flatView(source): # 1-D view of the memory under a 2-D array, with the flat steps between its pixels and where [0,0] is
+  # ravel() would copy views like the flipped breezyMap, so pixels are gathered from this instead
+  rowStep, colStep = source.strides[0]//source.itemsize, source.strides[1]//source.itemsize
+  lowest = source[::-1 if rowStep < 0 else 1, ::-1 if colStep < 0 else 1] # same pixels, starting at the lowest address
+  span = (source.shape[0]-1)*abs(rowStep) + (source.shape[1]-1)*abs(colStep) + 1
+  origin = (source.shape[0]-1)*abs(rowStep)*(rowStep < 0) + (source.shape[1]-1)*abs(colStep)*(colStep < 0)
+  return as_strided(lowest, shape=(span,), strides=(source.itemsize,)), rowStep, colStep, origin
+
+class NearestResizer(object):
+  # init    allocates the output buffer for maps resized to shape
+  # resize  fills the output with the nearest source pixel of each output pixel, like imresize(..., interp='nearest')
+
+  def __init__(self, shape):
+    self.shape = tuple(shape) # (rows, cols)
+    self.output = np.empty(self.shape, dtype=np.uint8)
+    self.lookups = {} # flat index of the nearest source pixel of each output pixel, by source layout
+    self.gathered = {} # gather buffers for sources that aren't uint8, by dtype
+
+  def resize(self, source):
+    flat, rowStep, colStep, origin = flatView(source)
+    layout = (source.shape, rowStep, colStep, origin)
+    if layout not in self.lookups: # only once per map size and memory layout
+      rows = ((np.arange(self.shape[0]) + 0.5)*source.shape[0]/self.shape[0]).astype(np.intp) # pixel centers, as PIL picks them
+      cols = ((np.arange(self.shape[1]) + 0.5)*source.shape[1]/self.shape[1]).astype(np.intp)
+      self.lookups[layout] = origin + rows[:,np.newaxis]*rowStep + cols*colStep
+    if source.dtype == np.uint8: return np.take(flat, self.lookups[layout], out=self.output)
+    if source.dtype not in self.gathered: self.gathered[source.dtype] = np.empty(self.shape, dtype=source.dtype)
+    np.take(flat, self.lookups[layout], out=self.gathered[source.dtype])
+    np.copyto(self.output, self.gathered[source.dtype], casting='unsafe') # display maps are all 0-255
+    return self.output
+
+class RotatedSampler(object):
+  # init    preallocates the lookup and interpolation buffers for a square output of size pixels
+  # sample  fills output with the source map around a point, rotated by an angle and linearly interpolated
+
+  def __init__(self, size, fill=255):
+    self.fill = fill # value of output pixels that fall outside the source map
+    offsets = np.arange(size) - (size-1)/2.0 # output pixel centers relative to the sampled point
+    self.rowOffsets, self.colOffsets = np.meshgrid(offsets, offsets, indexing='ij')
+    self.output = np.empty((size, size), dtype=np.uint8)
+    self.output.fill(fill)
+    self.rows, self.cols, self.rowFrac, self.colFrac, self.top, self.bottom = [np.empty((size, size)) for i in range(6)]
+    self.rowIndex, self.colIndex, self.index = [np.empty((size, size), dtype=np.intp) for i in range(3)]
+    self.outside, self.outsideTemp = np.empty((size, size), dtype=bool), np.empty((size, size), dtype=bool)
+    self.corners = [np.empty((size, size), dtype=np.uint8) for i in range(4)]
+
+  def sample(self, source, row, col, angle): # source is a uint8 map (any view), row, col are continuous indices, angle [deg]
+    c, s = cos(radians(angle)), sin(radians(angle))
+    rows, cols, rowFrac, colFrac, top, bottom = self.rows, self.cols, self.rowFrac, self.colFrac, self.top, self.bottom
+    np.multiply(self.rowOffsets, c, out=rows) # source coordinates of the output pixels, so the map turns counterclockwise like rotate()
+    np.multiply(self.colOffsets, s, out=top)
+    rows += top
+    rows += row
+    np.multiply(self.colOffsets, c, out=cols)
+    np.multiply(self.rowOffsets, s, out=top)
+    cols -= top
+    cols += col
+
+    np.floor(rows, out=rowFrac) # split coordinates into the upper-left neighbor and the fraction past it
+    np.copyto(self.rowIndex, rowFrac, casting='unsafe')
+    rowFrac -= rows
+    np.negative(rowFrac, out=rowFrac)
+    np.floor(cols, out=colFrac)
+    np.copyto(self.colIndex, colFrac, casting='unsafe')
+    colFrac -= cols
+    np.negative(colFrac, out=colFrac)
+
+    outside, temp = self.outside, self.outsideTemp # pixels needing a neighbor off the map are filled instead
+    np.less(self.rowIndex, 0, out=outside)
+    np.greater(self.rowIndex, source.shape[0]-2, out=temp)
+    outside |= temp
+    np.less(self.colIndex, 0, out=temp)
+    outside |= temp
+    np.greater(self.colIndex, source.shape[1]-2, out=temp)
+    outside |= temp
+    np.clip(self.rowIndex, 0, source.shape[0]-2, out=self.rowIndex)
+    np.clip(self.colIndex, 0, source.shape[1]-2, out=self.colIndex)
+
+    flat, rowStep, colStep, origin = flatView(source)
+    index, (upperLeft, upperRight, lowerLeft, lowerRight) = self.index, self.corners
+    np.multiply(self.rowIndex, rowStep, out=index)
+    np.multiply(self.colIndex, colStep, out=self.colIndex)
+    index += self.colIndex
+    index += origin
+    np.take(flat, index, out=upperLeft)
+    index += colStep
+    np.take(flat, index, out=upperRight)
+    index += rowStep
+    np.take(flat, index, out=lowerRight)
+    index -= colStep
+    np.take(flat, index, out=lowerLeft)
+
+    np.subtract(upperRight, upperLeft, out=top, dtype=float) # interpolate along the rows, then between them
+    top *= colFrac
+    top += upperLeft
+    np.subtract(lowerRight, lowerLeft, out=bottom, dtype=float)
+    bottom *= colFrac
+    bottom += lowerLeft
+    bottom -= top
+    bottom *= rowFrac
+    top += bottom
+    top += 0.5 # round
+    np.copyto(self.output, top, casting='unsafe')
+    np.copyto(self.output, self.fill, where=outside)
+    return self.output
+
+MOVES = [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)] # (row, col) steps to all eight neighbors
+LETHAL_COST = 254 # cost map value where the robot certainly collides
+INSCRIBED_COST = 253 # cost map value where the robot may collide, depending on heading (planners treat it as a wall)
 class AStarMap(object):
-  def __init__(self, mapMatrix):
-    # mapMatrix is bool array, True where roads, False where obstacles
-    self.walls = np.logical_not(mapMatrix)
+  # init       precomputes flat neighbor offsets, move costs and wall (or cost map) penalties for a road map
+  # toFlat     returns the flat index into the bordered map of a (row, col) point
+  # toPoints   returns the (row, col) points of a list of flat indices, as an array
+  # distance   returns the octile lower bound on the cost between two flat indices
+  # search     returns the path from startPoint to endPoint as an array of (row, col), or None if there is none
+
+  def __init__(self, mapMatrix, costMatrix=None):
+    # mapMatrix is bool array, True where roads, False where obstacles (mode 6 of DataMatrix.getMapMatrix works as is)
+    # costMatrix is optional uint8 array of extra cost to enter each pixel, like CostMap.costs, which replaces the wall count penalty
     hgt, wid = mapMatrix.shape
-    self.nodes = np.array([[AStarNode((row, col)) for row in range(hgt)] for col in range(wid)])
-    self.neighbors = {} # maps each node to references to its neighbors (called a graph if you like math) # should be stored in node data object...
-    for row, col in ((i,j) for i in range(hgt) for j in range(wid)):
-      node = nodes[row, col]
-      self.neighbors[node] = []
-      counter = 8
-      for r, c in ((row+i,col+j) for i in [-1,0,1] for j in [-1,0,1] if not (i==0 and j==0)): # all neighbors (excluding current)
-        if not (0<=r<hgt or 0<=c<wid): continue # don't add out-of-bounds neighbors
-        if self.walls[r, c]: continue # don't add neighbors in walls (fixed boundaries are defined here)
-        counter -= 1
-        self.neighbors[self.nodes[row, col]].append(self.nodes[r, c]) # add neighbor
-      node.numWalls = counter
-
-  def heuristic(self, current, start, end):
-    # defined as path length to end (ignoring obstacles)
-    dist_row = abs(current.row-end.row)
-    dist_col = abs(current.col-end.col)
-    return 101*abs(dist_row - dist_col) + 142*min(dist_row, dist_col) # favor proximity to end over proximity to start
-      
+    roads = np.zeros((hgt+2, wid+2), dtype=bool) # border of walls keeps flat neighbor offsets from wrapping between rows
+    roads[1:-1,1:-1] = mapMatrix
+    self.shape, self.width = roads.shape, wid+2
+    self.useCosts = costMatrix is not None
+    if self.useCosts:
+      roads[1:-1,1:-1] &= costMatrix < INSCRIBED_COST # too close to obstacles for the robot to fit
+      enterCost = np.zeros(roads.shape, dtype=int)
+      enterCost[1:-1,1:-1] = costMatrix
+    else:
+      numWalls = 8 - sum(np.roll(np.roll(roads, -dr, axis=0), -dc, axis=1).astype(int) for dr, dc in MOVES) # walls bordering each node
+      enterCost = 70*numWalls # costs more to travel near walls
+    self.roads = roads.ravel().tolist() # plain lists index much faster than arrays inside the search loop
+    self.enterCost = enterCost.ravel().tolist()
+    self.moves = [(dr*self.width + dc, 141 if dr and dc else 100) for dr, dc in MOVES] # (flat offset, move cost)
+
+  def toFlat(self, point):
+    return (point[0]+1)*self.width + point[1]+1
+
+  def toPoints(self, flats):
+    flats = np.array(flats, dtype=int)
+    return np.column_stack((flats // self.width - 1, flats % self.width - 1))
+
+  def distance(self, a, b):
+    dist_row, dist_col = abs(a//self.width - b//self.width), abs(a%self.width - b%self.width)
+    return 100*abs(dist_row - dist_col) + 141*min(dist_row, dist_col) # never more than the true cost, so paths are the cheapest
+
   def search(self, startPoint, endPoint):
-    start, end = self.nodes[startPoint], self.nodes[endPoint]
-    openSet, closedSet = set(), set()
-    current = start # start at beginning
-    openSet.add(current) # begin with first node as only open one
-    while openSet: # as long as there are open nodes
-      current = min(openSet, key=lambda node: node.g+node.h) # proceed with best node
-      if current == end: # done
-        path = []
-        while current.parent != self.nodes[current.parent].parent: # create path from end to start via parents of current
-          path.append((current.row, current.col))
-          current = self.nodes[current.parent]
-        path.append(current) # add start (whose parent is itself)
-        return path[::-1] # reverse order to give proper direction
-      openSet.remove(current) # close current node
-      closedSet.add(current)
-      for neighbor in self.neighbors[current]: # proceed by acting on all neighbors of current node
-        if neighbor in closedSet: # ignore node if closed
-          continue
-        if node in openSet: # determine if path from current is better than path from parent
-          g = current.g + current.moveCost(neighbor)
-          if neighbor.g > g: # moving to neighbor node from current node is better than from neighbor's parent
-            neighbor.g = g # update with new path
-            neighbor.parent = current.index
-        else: # activate child node
-          neighbor.g = current.g + current.moveCost(neighbor)
-          neighbor.h = self.heuristic(neighbor, start, end)
-          neighbor.parent = current.index
-          openSet.add(node)
+    start, end = self.toFlat(startPoint), self.toFlat(endPoint)
+    roads, enterCost, moves = self.roads, self.enterCost, self.moves
+    if not (roads[start] and roads[end]): return None
+    distance = self.distance # estimated as each node is reached, rather than for the whole map up front
+    g, parent, closed = {start: 0}, {start: start}, set() # cost to get to each node reached, so short plans stay short on big maps
+    openHeap = [(distance(start, end), 0, start)] # begin with first node as only open one
+    while openHeap: # as long as there are open nodes
+      current = heappop(openHeap)[2] # proceed with best node
+      if current in closed: continue # stale entry for a node already reached more cheaply
+      if current == end: # done, so create path from end to start via parents
+        path = [current]
+        while current != start:
+          current = parent[current]
+          path.append(current)
+        return self.toPoints(path[::-1]) # reverse order to give proper direction
+      closed.add(current)
+      gCurrent = g[current]
+      for offset, moveCost in moves: # proceed by acting on all neighbors of current node
+        neighbor = current + offset
+        if not roads[neighbor] or neighbor in closed: continue
+        gNeighbor = gCurrent + moveCost + enterCost[neighbor]
+        if gNeighbor < g.get(neighbor, gNeighbor + 1): # moving to neighbor node from current node is better than any path found so far
+          g[neighbor], parent[neighbor] = gNeighbor, current
+          heappush(openHeap, (gNeighbor + distance(neighbor, end), -gNeighbor, neighbor)) # ties go to the node nearest the end
     return None # ran out of open nodes with no path available
 
-class AStarNode(object):
-  def __init__(self, (row, col)):
-    self.g = 0 # cost to get here (includes distance and other stuff)
-    self.h = 0 # heuristic cost (affects which open node to explore next)
-    self.numWalls = 8 # number of walls that border this node
-    self.index = (row, col) # location of self
-    self.parent = (row, col) # location of parent
-
-  def moveCost(self, that): # calculate g of moving from self to that
-    corner = ((self.row - that.row) + (self.col - that.col)) % 2 == 0
-    return (141 if corner else 100) + 70*that.numWalls # costs more to travel near walls
\ No newline at end of file
+class DStarLite(AStarMap):
+  # D* Lite (Koenig and Likhachev, 2002): searches from the end back to the robot and keeps that search between scans,
+  # so when road pixels change, only the nodes whose cost to the end changed are expanded again
+  # init         runs the first search from startPoint to endPoint
+  # moveTo       moves the start of the search as the robot drives
+  # updateCells  applies changed road pixels, reopens the nodes whose cost to the end they change, and returns how many changed
+  # computePath  expands nodes until the cost from the start is consistent again, and returns the number expanded
+  # getPath      returns the current best path from the start to the end as an array of (row, col), or None if there is none
+
+  def __init__(self, mapMatrix, startPoint, endPoint, costMatrix=None):
+    AStarMap.__init__(self, mapMatrix, costMatrix)
+    size = len(self.roads)
+    inside = np.zeros(self.shape, dtype=bool)
+    inside[1:-1,1:-1] = True
+    self.inside = inside.ravel().tolist() # border nodes are never expanded
+    self.end = self.toFlat(endPoint)
+    self.roads[self.end] = True # can always arrive at the end, even before it is known to be road
+    for node in [self.end + offset for offset, moveCost in self.moves if self.inside[self.end + offset] and not self.useCosts]:
+      self.enterCost[node] = 70*sum(not self.roads[node+offset] for offset, moveCost in self.moves) # so the end is no wall
+    self.g = [float('inf')]*size # cost from each node to the end
+    self.rhs = [float('inf')]*size # one-step lookahead of g, which differs from g where the search needs repairing
+    self.rhs[self.end] = 0
+    self.km = 0 # accumulated heuristic offset from the start moving, which keeps old keys in the heap valid
+    self.start = self.last = self.toFlat(startPoint)
+    self.openHeap, self.openKeys = [], {} # heap of (key, node), and each open node's current key
+    self.updateNode(self.end)
+    self.computePath()
+
+  def key(self, node):
+    best = min(self.g[node], self.rhs[node])
+    return (best + self.distance(self.start, node) + self.km, best)
+
+  def updateNode(self, node): # (re)open node if it needs repairing, otherwise close it
+    if self.g[node] != self.rhs[node]:
+      key = self.key(node)
+      self.openKeys[node] = key
+      heappush(self.openHeap, (key, node))
+    else: self.openKeys.pop(node, None)
+
+  def lookahead(self, node): # best cost to the end through any neighbor
+    g, roads, enterCost = self.g, self.roads, self.enterCost
+    return min([moveCost + enterCost[node+offset] + g[node+offset] for offset, moveCost in self.moves if roads[node+offset]] or [float('inf')])
+
+  def moveTo(self, point):
+    start = self.toFlat(point)
+    if start != self.start and self.inside[start]:
+      self.start = start
+      self.km += self.distance(self.last, self.start)
+      self.last = self.start
+
+  def updateCells(self, rows, cols, mapMatrix, costMatrix=None): # pass costMatrix if the planner was made with one
+    roads, enterCost, inside, moves, g, rhs = self.roads, self.enterCost, self.inside, self.moves, self.g, self.rhs
+    if self.useCosts:
+      cells = dict((self.toFlat(point), (bool(mapMatrix[point] and costMatrix[point] < INSCRIBED_COST), int(costMatrix[point])))
+                   for point in zip(rows, cols))
+      if self.end in cells: cells[self.end] = (True, cells[self.end][1]) # the end stays reachable, but its cost can change
+      changed = [node for node, cell in cells.items() if (roads[node], enterCost[node]) != cell]
+      walled = changed
+    else:
+      changed = [node for node, road in ((self.toFlat(point), bool(mapMatrix[point])) for point in zip(rows, cols))
+                 if node != self.end and roads[node] != road]
+      walled = set(node+offset for node in changed for offset, moveCost in moves if inside[node+offset]).union(changed)
+    oldCost = dict((node, self.entryCost(node)) for node in walled) # the number of walls bordering these nodes may change
+    if self.useCosts:
+      for node in changed:
+        roads[node], enterCost[node] = cells[node]
+    else:
+      for node in changed:
+        roads[node] = not roads[node]
+      for node in walled:
+        enterCost[node] = 70*sum(not roads[node+offset] for offset, moveCost in moves)
+    for node in walled: # only neighbors whose best move could be the changed one need a new lookahead
+      old, new = oldCost[node], self.entryCost(node)
+      if old == new: continue
+      for offset, moveCost in moves:
+        neighbor = node - offset
+        if not inside[neighbor] or neighbor == self.end: continue
+        if new < old and moveCost + new + g[node] < rhs[neighbor]: # moving into node got cheaper
+          rhs[neighbor] = moveCost + new + g[node]
+          self.updateNode(neighbor)
+        elif new > old and rhs[neighbor] == moveCost + old + g[node]: # best move was into node, which got dearer
+          rhs[neighbor] = self.lookahead(neighbor)
+          self.updateNode(neighbor)
+    return len(changed)
+
+  def entryCost(self, node): # cost of moving into node, apart from the move itself
+    return self.enterCost[node] if self.roads[node] else float('inf')
+
+  def computePath(self):
+    g, rhs, roads, enterCost, inside, moves = self.g, self.rhs, self.roads, self.enterCost, self.inside, self.moves
+    openHeap, openKeys = self.openHeap, self.openKeys
+    expanded = 0
+    while openHeap:
+      key, node = openHeap[0]
+      if openKeys.get(node) != key: # stale entry for a node already updated or closed
+        heappop(openHeap)
+        continue
+      if not (key < self.key(self.start) or rhs[self.start] > g[self.start]): break # start is consistent, so path is optimal
+      expanded += 1
+      newKey = self.key(node)
+      if key < newKey: # key is out of date because the start moved
+        openKeys[node] = newKey
+        heapreplace(openHeap, (newKey, node))
+      elif g[node] > rhs[node]: # cost to end went down, so pass that on to neighbors
+        heappop(openHeap)
+        del openKeys[node]
+        g[node] = rhs[node]
+        if roads[node]:
+          for offset, moveCost in moves:
+            neighbor = node - offset
+            if inside[neighbor] and neighbor != self.end:
+              cost = moveCost + enterCost[node] + g[node]
+              if cost < rhs[neighbor]:
+                rhs[neighbor] = cost
+                self.updateNode(neighbor)
+      else: # cost to end went up, so neighbors that went through node have to find another way
+        gOld, g[node] = g[node], float('inf')
+        for neighbor in [node] + [node - offset for offset, moveCost in moves]:
+          if inside[neighbor] and neighbor != self.end:
+            if neighbor == node or rhs[neighbor] == self.moveCost(neighbor, node) + gOld:
+              rhs[neighbor] = self.lookahead(neighbor)
+            self.updateNode(neighbor)
+    return expanded
+
+  def moveCost(self, node, neighbor):
+    return (141 if abs(neighbor - node) not in (1, self.width) else 100) + self.enterCost[neighbor] if self.roads[neighbor] else float('inf')
+
+  def getPath(self):
+    if self.g[self.start] == float('inf') and self.rhs[self.start] == float('inf'): return None # no way to the end
+    g, roads, enterCost, moves = self.g, self.roads, self.enterCost, self.moves
+    path, node = [self.start], self.start
+    while node != self.end and len(path) < len(roads): # follow the cheapest neighbor to the end
+      cost, node = min([(moveCost + enterCost[node+offset] + g[node+offset], node+offset) for offset, moveCost in moves if roads[node+offset]] or [(float('inf'), node)])
+      if cost == float('inf'): return None
+      path.append(node)
+    return self.toPoints(path)
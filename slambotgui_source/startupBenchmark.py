@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# startupBenchmark.py - times how long the base station takes to start, before the serial port is opened
+#
+# Copyright (C) 2015 Michael Searing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# usage: python startupBenchmark.py [runs] [configuration ...]
+# each run starts a fresh interpreter, so nothing is already imported
+
+
+import sys, os, time, subprocess
+
+RUNS = 5 # fresh interpreters started per configuration
+CONFIGURATIONS = ['serial', 'headless', 'gui'] # serial link only, baseStationMain --headless, and the full windowed base station
+HEAVY_MODULES = ['scipy', 'matplotlib', 'Tkinter', 'tkinter', 'cv2', 'PIL', 'serial', 'breezyslam'] # reported when loaded
+
+
+def startUp(configuration): # does what baseStationMain does before opening the serial port
+  if configuration == 'serial':
+    from slambotgui.comms import SerialThread
+    from slambotgui.components import RPLIDAR
+    return
+
+  if configuration == 'headless': sys.argv.append('--headless')
+  import baseStationMain as base
+  kwargs = dict((key, getattr(base, key, None)) for key in base.KWARGS_keys) # logFile is set by __main__, so None here
+  base.DataMatrix(**kwargs)
+  base.Slam(base.DaguRover5(), base.RPLIDAR(base.DIST_MIN, base.DIST_MAX, base.SCAN_BINS), **kwargs)
+  if configuration == 'gui':
+    if base.FAST_MAPPING: import slambotgui.cvslamshow # loaded by the render thread once the first map is drawn
+    try: base.Tk().destroy()
+    except Exception: pass # no display, so only the imports are timed
+
+def runOnce(configuration): # returns (seconds, modules loaded, heavy modules loaded) from a fresh interpreter
+  child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', configuration],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+  out, err = child.communicate()
+  if child.returncode != 0: sys.exit("{0:s} failed to start:\n{1:s}".format(configuration, err.decode()))
+  result = out.decode().strip().split('\n')[-1].split(' ') # the last line, after anything printed on import
+  return float(result[0]), int(result[1]), result[2:]
+
+def main():
+  args = sys.argv[1:]
+  runs = int(args.pop(0)) if args and args[0].isdigit() else RUNS
+  configurations = args or CONFIGURATIONS
+  print("{0:<10s} {1:>10s} {2:>10s} {3:>8s}  {4:s}".format('startup', 'median [s]', 'best [s]', 'modules', 'heavy modules loaded'))
+  for configuration in configurations:
+    results = [runOnce(configuration) for run in range(runs)]
+    seconds = sorted(result[0] for result in results)
+    print("{0:<10s} {1:>10.3f} {2:>10.3f} {3:>8d}  {4:s}".format(configuration, seconds[len(seconds)//2], seconds[0],
+                                                                results[-1][1], ', '.join(results[-1][2]) or '-'))
+
+
+if __name__ == '__main__':
+  if len(sys.argv) == 3 and sys.argv[1] == '--child':
+    configuration = sys.argv.pop()
+    sys.argv.pop()
+    start = time.time()
+    startUp(configuration)
+    elapsed = time.time() - start
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(' '.join(["{0:.4f}".format(elapsed), str(len(sys.modules))] + heavy))
+  else: main()